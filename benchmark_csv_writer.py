@@ -0,0 +1,72 @@
+# Compares the csv writer of `dpa_fake_data_gen.py` (`write_csv()`) with
+# pandas' `to_csv()`.
+#
+# It accepts the same options as `dpa_fake_data_gen.py` (e.g.,
+# `python benchmark_csv_writer.py --n_subjs 40 --n_trials 80 --engine numpy`),
+# generates a single dataset with them (without forcing the divergence point,
+# since it doesn't matter for writing), and writes it with both writers,
+# uncompressed and compressed.
+import io
+import time
+
+import dpa_fake_data_gen as dpa
+
+
+def time_it(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def benchmark(df, compression):
+    # Writes into memory, so that we measure the writers and not the disk
+    pandas_out = io.BytesIO()
+    fast_out = io.BytesIO()
+
+    pandas_compression = None if compression == 'none' else {'method': compression}
+    if compression == 'gzip':
+        # Same level as `open_output()`
+        pandas_compression['compresslevel'] = 6
+    pandas_time = time_it(lambda: df.to_csv(pandas_out, compression=pandas_compression))
+
+    def write_fast():
+        # `open_output()` wants a file name, so we do what it does here
+        if compression == 'gzip':
+            f = dpa.gzip.GzipFile(fileobj=fast_out, mode='wb', compresslevel=6)
+        elif compression == 'zstd':
+            import zstandard    # requires `pip install zstandard`
+            f = zstandard.ZstdCompressor().stream_writer(fast_out, closefd=False)
+        else:
+            f = fast_out
+        dpa.write_csv(df, f)
+        if f is not fast_out:
+            f.close()
+    fast_time = time_it(write_fast)
+
+    same_output = None
+    if compression == 'none':
+        # (compressed outputs may differ in their headers, e.g., timestamps)
+        same_output = pandas_out.getvalue() == fast_out.getvalue()
+    return pandas_time, fast_time, len(fast_out.getvalue()), same_output
+
+
+if __name__ == '__main__':
+    args = dpa.parse_command_line()
+
+    print("Generating data")
+    params = dict(vars(args), force_dpoint=False, force_dpoint_me=False)
+    df = dpa.generate(params, seed=args.rand_seed, verbose=True).data
+    print()
+    print(len(df), "rows")
+
+    print("{:>12} {:>12} {:>12} {:>8} {:>12} {:>10}".format(
+        'compression', 'to_csv (s)', 'fast (s)', 'speedup', 'size (MB)', 'identical'))
+    for compression in ['none', 'gzip', 'zstd']:
+        try:
+            pandas_time, fast_time, size, same_output = benchmark(df, compression)
+        except ImportError:
+            print("{:>12} (skipped: library not installed)".format(compression))
+            continue
+        print("{:>12} {:>12.2f} {:>12.2f} {:>7.1f}x {:>12.1f} {:>10}".format(
+            compression, pandas_time, fast_time, pandas_time / fast_time,
+            size / 2**20, '-' if same_output is None else str(same_output)))
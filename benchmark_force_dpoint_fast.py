@@ -0,0 +1,104 @@
+# Compares `--force_dpoint_fast` with `--force_dpoint_me`, for every
+# combination of parameters in `config.py` (i.e., the datasets that
+# `run_generator.py` would produce).
+#
+# For each combination, it runs both methods a few times (each time with a new
+# random seed) and shows how far from `dpoint + cond*cond_effect` each of them
+# found the divergence point of the population (the "offset", which is how much
+# the trials get shifted), and how long each took. Only the population part is
+# timed, since the sampled participants are generated in the same way by both.
+#
+# E.g., `python benchmark_force_dpoint_fast.py --n_repetitions 5 --engine numpy`
+import time
+import random
+import argparse
+import statistics
+
+import dpa_fake_data_gen as dpa
+import run_generator as rg
+from config import config
+
+
+def get_offsets(divergence_points, args):
+    return {cond: None if dpoint is None else dpoint - (args.dpoint + cond*args.cond_effect)
+            for cond, dpoint in divergence_points.items()}
+
+def run_method(args, state):
+    # Returns the offsets and how long it took
+    start = time.perf_counter()
+    looks_buffer = dpa.LooksBuffer()
+    if args.force_dpoint_me:
+        # The sampled participants go into `looks_buffer`, but we only need
+        # the t-tests of the population
+        dpa.generate_data(args, state, looks_buffer)
+    _, _, divergence_points = dpa.find_divergence_point(looks_buffer, args, state)
+    return get_offsets(divergence_points, args), time.perf_counter() - start
+
+def benchmark(general_params, params, n_repetitions):
+    args = dpa.parse_command_line(
+        rg.get_generator_args(general_params, params, 'unused', 'unused'))
+    args.force_dpoint = False
+
+    results = {'exact': [], 'fast': []}
+    for _ in range(n_repetitions):
+        random.seed(rg.random_string())
+        # A new dataset has new items. Both methods use the same ones
+        state = dpa.DatasetState(args)
+
+        args.force_dpoint_me, args.force_dpoint_fast = True, False
+        results['exact'].append(run_method(args, state))
+        args.force_dpoint_me, args.force_dpoint_fast = False, True
+        results['fast'].append(run_method(args, state))
+    return results
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if len(values) == 0:
+        return "(none found)"
+    if len(values) == 1:
+        return "{:.1f}".format(values[0])
+    return "{:.1f} (sd {:.1f})".format(statistics.mean(values), statistics.stdev(values))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--n_repetitions', type=int, default=3,
+                           help='How many times each method runs for each '
+                                'combination of parameters')
+    argparser.add_argument('--engine', type=str, default=config['engine'],
+                           choices=['python', 'numpy'],
+                           help='Engine used by `force_dpoint_me` (the default '
+                                'is the one in `config.py`)')
+    argparser.add_argument('--pop_multiplier', type=int,
+                           default=config['population_multiplier'],
+                           help='The population multiplier (the default is the '
+                                'one in `config.py`)')
+    bench_args = argparser.parse_args()
+
+    general_params = dict(config)
+    general_params.update(engine=bench_args.engine,
+                          population_multiplier=bench_args.pop_multiplier,
+                          force_divergence_point=False,
+                          force_dp_memory_efficient=False,
+                          stream=False,
+                          profile=False)
+    params = {key: rg.parse_list(config[key]) for key in rg.DATASET_PARAMS}
+    varying = [key for key in rg.DATASET_PARAMS if len(params[key]) > 1]
+
+    print("{:>40} {:>5} {:>20} {:>20} {:>10} {:>10} {:>10} {:>8}".format(
+        'parameters', 'cond', 'offset (me)', 'offset (fast)', 'mean |diff|',
+        'me (s)', 'fast (s)', 'speedup'))
+    for param_set in rg.generate_combinations(params):
+        results = benchmark(general_params, param_set, bench_args.n_repetitions)
+        description = ' '.join("{}={}".format(key, param_set[key]) for key in varying) or 'defaults'
+
+        exact_time = statistics.mean(t for _, t in results['exact'])
+        fast_time = statistics.mean(t for _, t in results['fast'])
+        for cond in range(param_set['n_conds']):
+            exact = [offsets[cond] for offsets, _ in results['exact']]
+            fast = [offsets[cond] for offsets, _ in results['fast']]
+            diffs = [abs(e - f) for e, f in zip(exact, fast) if e is not None and f is not None]
+            print("{:>40} {:>5} {:>20} {:>20} {:>10} {:>10.2f} {:>10.2f} {:>7.1f}x".format(
+                description, cond, summarize(exact), summarize(fast),
+                "{:.1f}".format(statistics.mean(diffs)) if diffs else '-',
+                exact_time, fast_time, exact_time / fast_time))
@@ -0,0 +1,242 @@
+# Bootstrapped Divergence Point Analysis of a dataset produced by
+# `dpa_fake_data_gen.py`.
+#
+# `dpa_fake_data_gen.py` only runs a single DPA on the whole population. In a
+# "real" DPA, the participants are resampled (with replacement) many times,
+# and the DPA is run on every resample, which gives us a distribution (and a
+# confidence interval) for the divergence point of every condition, and for
+# the differences between conditions.
+#
+# We first turn the dataset into an array (participants x conditions x ms)
+# with the proportion of trials in which each participant was looking at the
+# Target. A resample is then just an array of participant indices, and the
+# sums over a resample are a product of matrices (with how many times each
+# participant was drawn), so we compute the t-tests of many resamples at once.
+# Batches of resamples can run in parallel, in separate processes.
+#
+# E.g., `python bootstrap_dpa.py fakedata_(...).txt --n_resamples 2000 --workers 4`
+import json
+import argparse
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import dpa_fake_data_gen as dpa
+
+
+# Set in every worker process by `init_worker()`, so that we don't send the
+# (possibly large) looks array with every batch
+worker_looks = None
+
+
+def read_dataset(in_file):
+    # Any of the `out_format`s of `dpa_fake_data_gen.py` (see `write_dataframe()`)
+    if in_file.endswith('.npy'):
+        return np.load(in_file, mmap_mode='r')
+    if in_file.endswith('.parquet'):
+        return pd.read_parquet(in_file)
+    if in_file.endswith('.feather'):
+        return pd.read_feather(in_file)
+    # (pandas decompresses .gz and .zst files by itself)
+    df = pd.read_csv(in_file)
+    # The csv files have the (unnamed) index as their first column, but the
+    # fixation reports don't
+    if df.columns[0].startswith('Unnamed'):
+        df = df.drop(columns=df.columns[0])
+    return df
+
+def get_looks_from_cube(cube):
+    # `cube` is the `npy` output (participants x conditions x trials x ms).
+    # The ms without data (`LOOK_MISSING`) don't count
+    looked_at_target = (cube == dpa.LOOK_TARGET).sum(axis=2)
+    has_data = (cube != dpa.LOOK_MISSING).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return looked_at_target / has_data, np.arange(cube.shape[3])
+
+def get_looks_from_fixations(df):
+    # `df` is a fixation report (see `FixationReportBuffer`). Same trick as in
+    # `get_subj_target_looks()`: every look to the Target adds 1 when it
+    # starts and removes it when it ends
+    participant = df['participant'].cat
+    participants = participant.codes.to_numpy()
+    conds = df['condition'].to_numpy()
+    n_ms = df['end'].max()
+    changes = np.zeros((len(participant.categories), conds.max() + 1, n_ms + 1))
+    target = (df['fixated_object'] == 'Target').to_numpy()
+    np.add.at(changes, (participants[target], conds[target], df['start'].to_numpy()[target]), 1)
+    np.add.at(changes, (participants[target], conds[target], df['end'].to_numpy()[target]), -1)
+
+    n_trials = df.groupby([participants, conds])['trial'].nunique()
+    n_trials = n_trials.unstack().to_numpy()[:, :, np.newaxis]
+    return np.cumsum(changes[:, :, :-1], axis=2) / n_trials, np.arange(n_ms)
+
+def get_looks_from_dataframe(df):
+    # `df` is a long or wide data frame (see `DatasetBuffer`)
+    per_ms_looks = dpa.get_per_ms_looks(df).set_index(['participant', 'condition', 'time'])
+    looks = per_ms_looks['mean_looks'].unstack('time')
+    times = looks.columns.to_numpy()
+    n_participants = per_ms_looks.index.get_level_values('participant').nunique()
+    return looks.to_numpy().reshape(n_participants, -1, len(times)), times
+
+def load_looks(in_file):
+    # Returns an array (participants x conditions x ms) with the proportion of
+    # trials in which the Target was being looked at, and the time of each ms
+    data = read_dataset(in_file)
+    if isinstance(data, np.ndarray):
+        return get_looks_from_cube(data)
+    # The participants go in the order they appear in the file (as in the
+    # `npy` output), so that the same seed draws the same resamples
+    data['participant'] = pd.Categorical(data['participant'],
+                                         categories=list(data['participant'].unique()))
+    if 'start' in data:
+        return get_looks_from_fixations(data)
+    return get_looks_from_dataframe(data)
+
+
+def get_resample_tvalues(looks, resamples, popmean=0.5):
+    # `looks` is (participants x conditions x ms) and `resamples` is
+    # (resamples x participants), with the indices of the participants drawn.
+    # Returns the t-values of every resample (resamples x conditions x ms)
+    n_participants = looks.shape[0]
+    flat_looks = looks.reshape(n_participants, -1)
+    # How many times each participant was drawn in each resample
+    counts = np.zeros((len(resamples), n_participants))
+    np.add.at(counts, (np.arange(len(resamples))[:, np.newaxis], resamples), 1)
+
+    n = resamples.shape[1]
+    mean = counts @ flat_looks / n
+    var = (counts @ flat_looks**2 / n - mean**2) * n / (n - 1)
+    tvalues = dpa.get_tvalues(mean, np.maximum(var, 0), n, popmean)
+    return tvalues.reshape(len(resamples), *looks.shape[1:])
+
+def find_divergence_points(tvalues, times, run_length, threshold, two_sided):
+    # Same as `find_divergence_point_using_ttests()`, for the t-values of many
+    # resamples at once (resamples x conditions x ms). Returns an array
+    # (resamples x conditions), with nan where no divergence point was found
+    significant = np.abs(tvalues) > threshold if two_sided else tvalues > threshold
+    counts = np.zeros(significant.shape[:-1] + (significant.shape[-1] + 1,), dtype=np.int64)
+    np.cumsum(significant, axis=-1, out=counts[..., 1:])
+    in_run = counts[..., run_length:] - counts[..., :-run_length] == run_length
+    found = in_run.any(axis=-1)
+    end_of_run = in_run.argmax(axis=-1) + run_length - 1
+    return np.where(found, times[np.minimum(end_of_run, len(times) - 1)] - run_length, np.nan)
+
+def init_worker(looks):
+    global worker_looks
+    worker_looks = looks
+
+def bootstrap_batch(seed, n_resamples, times, run_length, threshold, two_sided, looks=None):
+    # Runs `n_resamples` resamples, drawn with their own random number
+    # generator (so the results don't depend on which process runs them)
+    looks = worker_looks if looks is None else looks
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, looks.shape[0], size=(n_resamples, looks.shape[0]))
+    tvalues = get_resample_tvalues(looks, resamples)
+    return find_divergence_points(tvalues, times, run_length, threshold, two_sided)
+
+def bootstrap(looks, times, n_resamples, batch_size=100, workers=1, seed=None,
+              run_length=dpa.DPA_DISTANCE, threshold=dpa.TTEST_SIGNIFICANCE, two_sided=False):
+    # Returns the divergence points of every resample (resamples x conditions)
+    n_batches = -(-n_resamples // batch_size)
+    batch_sizes = [batch_size] * (n_batches - 1) + [n_resamples - batch_size * (n_batches - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_batches)
+    batch_args = [(batch_seed, size, times, run_length, threshold, two_sided)
+                  for batch_seed, size in zip(seeds, batch_sizes)]
+
+    if workers <= 1:
+        return np.concatenate([bootstrap_batch(*a, looks=looks) for a in batch_args])
+
+    looks = np.ascontiguousarray(looks)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=init_worker,
+                                                initargs=(looks,)) as executor:
+        return np.concatenate(list(executor.map(bootstrap_batch, *zip(*batch_args))))
+
+def summarize(divergence_points, observed, confidence=0.95):
+    # Mean, SD and percentile confidence interval of the divergence point of
+    # every condition, and of its difference to condition 0
+    tail = (1 - confidence) / 2 * 100
+
+    def describe(values, observed_value):
+        found = values[~np.isnan(values)]
+        return {
+            'observed': None if np.isnan(observed_value) else float(observed_value),
+            'mean': float(found.mean()) if len(found) else None,
+            'sd': float(found.std(ddof=1)) if len(found) > 1 else None,
+            'ci': [float(np.percentile(found, tail)), float(np.percentile(found, 100 - tail))]
+                  if len(found) else None,
+            'not_found': int(len(values) - len(found)),
+        }
+
+    summary = {'n_resamples': len(divergence_points), 'confidence': confidence,
+               'conditions': {}, 'differences': {}}
+    for cond in range(divergence_points.shape[1]):
+        summary['conditions'][cond] = describe(divergence_points[:, cond], observed[cond])
+        if cond > 0:
+            summary['differences']["{} - 0".format(cond)] = \
+                describe(divergence_points[:, cond] - divergence_points[:, 0],
+                         observed[cond] - observed[0])
+    return summary
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('in_file',
+                           help='A dataset produced by `dpa_fake_data_gen.py` (in '
+                                'any `out_format`)')
+    argparser.add_argument('--n_resamples', type=int, default=2000,
+                           help='How many times the participants are resampled')
+    argparser.add_argument('--batch_size', type=int, default=100,
+                           help='How many resamples are computed at once (larger '
+                                'batches are faster, but use more memory)')
+    argparser.add_argument('--workers', type=int, default=1,
+                           help='How many processes run the batches')
+    argparser.add_argument('--seed', type=int, default=None,
+                           help='Random seed. The results are the same for any '
+                                'number of `workers` (but not for any `batch_size`)')
+    argparser.add_argument('--confidence', type=float, default=0.95,
+                           help='Size of the confidence intervals')
+    argparser.add_argument('--dpa_run_length', type=int, default=dpa.DPA_DISTANCE,
+                           help='Same as in `dpa_fake_data_gen.py`')
+    argparser.add_argument('--dpa_threshold', type=float, default=dpa.TTEST_SIGNIFICANCE,
+                           help='Same as in `dpa_fake_data_gen.py`')
+    argparser.add_argument('--dpa_sides', type=str, default='one', choices=['one', 'two'],
+                           help='Same as in `dpa_fake_data_gen.py`')
+    argparser.add_argument('--out_file', type=str, default=None,
+                           help='Where to write the results (as json). By default, '
+                                '`<in_file>.bootstrap.json`')
+    args = argparser.parse_args()
+    two_sided = args.dpa_sides == 'two'
+
+    print("Reading", args.in_file)
+    looks, times = load_looks(args.in_file)
+    print(" *", looks.shape[0], "participants,", looks.shape[1], "conditions,",
+          looks.shape[2], "ms")
+
+    # The DPA of the dataset itself (i.e., without resampling)
+    observed = find_divergence_points(
+        dpa.ttest_1samp_matrix(looks)[np.newaxis], times,
+        args.dpa_run_length, args.dpa_threshold, two_sided)[0]
+
+    print("Bootstrapping", args.n_resamples, "resamples")
+    divergence_points = bootstrap(looks, times, args.n_resamples, args.batch_size,
+                                  args.workers, args.seed, args.dpa_run_length,
+                                  args.dpa_threshold, two_sided)
+    summary = summarize(divergence_points, observed, args.confidence)
+    summary['in_file'] = args.in_file
+    summary['seed'] = args.seed
+
+    labelled = [("condition " + str(cond), values) for cond, values in summary['conditions'].items()] + \
+               [("difference " + name, values) for name, values in summary['differences'].items()]
+    for label, values in labelled:
+        ci = "[{:.1f}, {:.1f}]".format(*values['ci']) if values['ci'] else "-"
+        print("{:>18}: observed {}, mean {}, {:.0f}% CI {} ({} resamples without divergence)".format(
+            label, values['observed'],
+            "-" if values['mean'] is None else "{:.1f}".format(values['mean']),
+            args.confidence * 100, ci, values['not_found']))
+
+    out_file = args.out_file or args.in_file + '.bootstrap.json'
+    with open(out_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print("Results written into", out_file)
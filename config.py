@@ -2,6 +2,20 @@ config = {
     # Datasets per parameter set
     'n_datasets_per_paramset': 1,
 
+    # How many datasets are generated at the same time (with `workers`, every
+    # one of them uses that many processes), and how many times a dataset
+    # that failed is generated again
+    'jobs': 1,
+    'retries': 1,
+
+    # Skip the datasets that the manifest of the output folder says are done
+    'resume': False,
+
+    # Generate the datasets in long-lived processes that import the generator
+    # only once, each replaced after `jobs_per_worker` datasets (0 = never)
+    'worker_pool': False,
+    'jobs_per_worker': 50,
+
     # Random seed
     'rand_seed': 1234,
 
@@ -20,9 +34,55 @@ config = {
     # Force Divergence Point (Memory efficient)
     'force_dp_memory_efficient': True,
 
+    # Force Divergence Point (Fast, approximate)
+    'force_dp_fast': False,
+
     # Population Multiplier'
     'population_multiplier': 1,
 
+    # Population DPA: how many consecutive significant ms, the t-value
+    # threshold, and whether the t-tests are one or two sided ('one' or 'two')
+    'dpa_run_length': 200,
+    'dpa_threshold': 1.96,
+    'dpa_sides': 'one',
+
+    # Adaptive population size: stop simulating the population when the
+    # divergence points moved at most this many ms since the previous batch
+    # ('' for a fixed size), and how many participants per batch (0 for the
+    # number of participants). `population_multiplier` is then the maximum
+    'population_tolerance': '',
+    'population_batch': 0,
+
+    # Folder where the divergence points of the populations are kept, so that
+    # they are not simulated again ('' for no cache), and its maximum size
+    'population_cache': '',
+    'population_cache_max_mb': 100,
+
+    # Generation engine ('python' or 'numpy')
+    'engine': 'python',
+
+    # Processes generating the participants of each dataset (0 for the old,
+    # single process, generation. Any other number gives the same datasets)
+    'workers': 0,
+
+    # Write participants into the output file as they are generated
+    'stream': False,
+
+    # Background writer queue size (0 for no background writer)
+    'writer_queue': 0,
+
+    # Output file format ('csv', 'parquet', 'feather', 'npy' or 'fixations')
+    'out_format': 'csv',
+
+    # Output layout ('long' or 'wide')
+    'layout': 'long',
+
+    # Compression of text outputs ('none', 'gzip' or 'zstd')
+    'compression': 'none',
+
+    # Measure how long each stage takes (and how much memory it uses)
+    'profile': False,
+
     # Number of participants
     'n_subjs': 40,
 
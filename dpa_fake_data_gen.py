@@ -4,9 +4,21 @@
 
 # Imports that produce dependencies
 import pandas as pd    # requires `pip install pandas`
+import numpy as np     # comes along with pandas
 
 # Python native imports
 import os
+import sys
+import json
+import hashlib
+import gzip
+import time
+import queue
+import threading
+import collections
+import concurrent.futures
+import contextlib
+import tracemalloc
 import math
 import argparse
 import random
@@ -22,17 +34,114 @@ DPA_DISTANCE = 200           # How many consecutive ttests need to be significan
                              # for us to decide we found a divergence
 TTEST_SIGNIFICANCE = 1.96
 
-FIXATION_LEN_MU = 215        # Fixations should be between 180 and 250. 215 is the
-FIXATION_LEN_SD = 35         # midpoint, and 215-35=180, and 215+35=250
+# The outputs are written into files ending in this first (see
+# `get_partial_file()`)
+PARTIAL_SUFFIX = '.partial'
 
+POPULATION_CACHE_VERSION = 2 # Change this whenever the participants generated
+                             # (by either engine) change, so that the divergence
+                             # points in `--population_cache` are not reused
 
-all_fixation_lengths = []                               # for stats
-all_subjs_per_ms_looks = []                             # for `force_dpoint_me`
-item_dpoint_biases = {}
-item_dspeed_biases = {}
-item_prob_biases = {}
+# With `force_dpoint_fast`, the participants are drawn in batches of (at most)
+# this many probabilities (trials x ms)
+ESTIMATE_BATCH_PROBS = 2**21
 
-def parse_command_line():
+FIXATION_LEN_MU = 215        # Fixations should be between 180 and 250. 215 is the
+FIXATION_LEN_SD = 35         # midpoint, and 215-35=180, and 215+35=250
+
+# The objects a participant can be looking at. Internally, we store looks as
+# the index of the object in this list (i.e., as small integer codes)
+OBJECTS = ['Target', 'Distractor', 'Away']
+LOOK_TARGET, LOOK_DISTRACTOR, LOOK_AWAY = range(len(OBJECTS))
+LOOK_MISSING = 255           # In the `npy` output, a ms for which there is no data
+
+
+worker_state = None                                     # for `--workers`
+
+
+class Profiler:
+    # Keeps, for every stage of the program, how long it took, how many
+    # "rows" it processed (what a row is depends on the stage) and the peak
+    # memory while it ran. Does nothing unless `enabled` (see `--profile`)
+    def __init__(self):
+        self.enabled = False
+        self.start_time = time.perf_counter()
+        self.stages = {}
+
+    def enable(self):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        # (somebody else may be tracing already, e.g. a notebook)
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def disable(self):
+        # Tracing memory makes everything slower, so it must not go on after
+        # the dataset was generated (e.g., in the next `generate()`)
+        if self.enabled and self.started_tracing:
+            tracemalloc.stop()
+        self.enabled = False
+
+    # If the number of rows is only known at the end, the caller can set it in
+    # the yielded dict
+    @contextlib.contextmanager
+    def stage(self, name, rows=0, rows_unit=None):
+        counts = {'rows': rows}
+        if not self.enabled:
+            yield counts
+            return
+
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield counts
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        rows = counts['rows']
+
+        stage = self.stages.setdefault(name, {'time_s': 0, 'calls': 0, 'rows': 0,
+                                              'rows_unit': rows_unit,
+                                              'peak_traced_mb': 0})
+        stage['rows_unit'] = stage['rows_unit'] or rows_unit
+        stage['time_s'] += elapsed
+        stage['calls'] += 1
+        stage['rows'] += rows
+        stage['peak_traced_mb'] = max(stage['peak_traced_mb'], peak / 2**20)
+
+    def report(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            stages[name]['rows_per_s'] = stage['rows'] / stage['time_s'] \
+                                            if stage['time_s'] > 0 else None
+        return {
+            'total_time_s': time.perf_counter() - self.start_time,
+            'peak_rss_mb': get_peak_rss_mb(),
+            'peak_traced_mb': tracemalloc.get_traced_memory()[1] / 2**20,
+            'stages': stages
+        }
+
+    def dump(self, out_file, args):
+        with open(out_file + '.profile.json', 'w') as f:
+            report = self.report()
+            report['parameters'] = vars(args)
+            json.dump(report, f, indent=2)
+
+def get_peak_rss_mb():
+    # The `resource` module doesn't exist in Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives us KB, and Mac gives us bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+profiler = Profiler()
+
+
+def parse_command_line(argv=None):
+    # (`argv=[]` gives the defaults, see `generate()`)
     description = ''
     argparser = argparse.ArgumentParser(description=description)
     argparser.add_argument('--n_subjs', metavar='n_subjs',
@@ -241,10 +350,106 @@ def parse_command_line():
 
 
 
+    argparser.add_argument('--engine', metavar='engine',
+                           type=str, default='python',
+                           choices=['python', 'numpy'],
+                           help='Which implementation generates the trials. '
+                                '"python" is the reference implementation, which '
+                                'goes through every trial one millisecond at a '
+                                'time. "numpy" generates all trials of a '
+                                'participant at once, as 2D arrays (trials x ms). '
+                                'It is MUCH faster, and follows the same model, '
+                                'but it uses a different random number generator '
+                                '(so the same `rand_seed` gives different data in '
+                                'the two engines).')
+
+    argparser.add_argument('--workers', metavar='workers',
+                           type=int, default=None,
+                           help='If set, the participants are generated by this '
+                                'many processes. Every participant then has its '
+                                'own random numbers (derived from `rand_seed` and '
+                                'its index), and the item effects are drawn '
+                                'before any participant, so the data is exactly '
+                                'the same for any number of `workers` (including '
+                                '1). It is NOT the same as without `workers`, '
+                                'where all participants share a single sequence '
+                                'of random numbers.')
+
     argparser.add_argument('--out_file', metavar='out_file',
                            type=str, default='fake_data.csv',
                            help='File to be produced with the data')
 
+    argparser.add_argument('--out_format', metavar='out_format',
+                           type=str, default='csv',
+                           choices=['csv', 'parquet', 'feather', 'npy', 'fixations'],
+                           help='The format of `out_file`. "csv" is a text file '
+                                'that can be opened anywhere. "parquet" and '
+                                '"feather" (both require library pyarrow) are '
+                                'binary formats that are MUCH smaller and faster '
+                                'to write and to read (e.g., with '
+                                '`pd.read_parquet()` in Python, or '
+                                '`arrow::read_parquet()` in R). In them, the '
+                                'text columns are stored as categories and the '
+                                'unnamed index column is not stored. "npy" '
+                                'stores only which object was looked at, as a '
+                                'numpy array (participants x conditions x trials '
+                                'x ms) of indices into ["Target", "Distractor", '
+                                '"Away"] (255 means "no data"), that can be read '
+                                'with `np.load(out_file, mmap_mode="r")`. The ids '
+                                'of participants and trials and the parameters '
+                                'go into a .json file next to `out_file`. '
+                                '"fixations" produces a csv file with one row per '
+                                'fixation (like the fixation reports of '
+                                'eye-trackers), with its `start` and `end` (in '
+                                'ms, `end` exclusive), `duration` and the '
+                                '`fixated_object`. (`--layout` has no effect on '
+                                'it)')
+
+    argparser.add_argument('--writer_queue', metavar='writer_queue',
+                           type=int, default=0,
+                           help='(Requires `--stream`) If larger than 0, '
+                                'participants are written into `out_file` by a '
+                                'background thread, while the next ones are '
+                                'being generated. This is how many generated '
+                                'participants can be waiting to be written (more '
+                                'means more memory, but less waiting). 2 is '
+                                'usually enough.')
+
+    argparser.add_argument('--compression', metavar='compression',
+                           type=str, default='none',
+                           choices=['none', 'gzip', 'zstd'],
+                           help='Compress `out_file` while writing it. Only for '
+                                'the text formats (`--out_format` csv and '
+                                'fixations). "zstd" requires library zstandard. '
+                                'The name of `out_file` is not changed, so you '
+                                'probably want to add ".gz" or ".zst" to it.')
+
+    argparser.add_argument('--layout', metavar='layout',
+                           type=str, default='long',
+                           choices=['long', 'wide'],
+                           help='"long" produces two rows per ms (one for the '
+                                'Target and one for the Distractor, with columns '
+                                '`object` and `is_looking`). "wide" produces a '
+                                'single row per ms, with a column '
+                                '`fixated_object` that is either "Target", '
+                                '"Distractor" or "Away". (It is half the size, '
+                                'and keeps the looks away from the monitor, which '
+                                'in "long" are just two zeros)')
+
+    argparser.add_argument('--stream',
+                           default=False,
+                           action='store_true',
+                           help='If set, every participant is written into '
+                                '`out_file` as soon as it is generated, instead '
+                                'of keeping the whole dataset in memory and '
+                                'writing it at the end. The file is the same. '
+                                'With `force_dpoint[_me]`, the divergence point '
+                                'is only known after the whole population is '
+                                'generated, so until then we keep (only) the '
+                                'looks of the sampled participants, which are '
+                                'much smaller than the final data. (Not '
+                                'available with `--out_format feather`)')
+
     argparser.add_argument('--rand_seed', metavar='rand_seed',
                            type=str, default=None,
                            help='File to be produced with the data')
@@ -254,7 +459,7 @@ def parse_command_line():
     group.add_argument('--force_dpoint',
                            default=False,
                            action='store_true',
-                           help='(Requires library scipy) If set, the generated '
+                           help='If set, the generated '
                                 'datasets will generate a much larger population, '
                                 'go through a simple DPA on that population, and '
                                 'then use the divergence point found to "shift" '
@@ -268,9 +473,26 @@ def parse_command_line():
     group.add_argument('--force_dpoint_me',
                            default=True,
                            action='store_true',
-                           help='(Requires library scipy) A memory efficient '
+                           help='A memory efficient '
                                 'version of the `force_dpoint` flag.')
 
+    group.add_argument('--force_dpoint_fast',
+                           default=False,
+                           action='store_true',
+                           help='An approximate (but MUCH faster) version of the '
+                                '`force_dpoint` flag. Instead of simulating the '
+                                'fixations of the larger population and running '
+                                'a DPA on them, it estimates the population '
+                                'divergence point from the probabilities of '
+                                'looks to the Target of every trial (see '
+                                '`estimate_divergence_points()`). Only `n_subjs` '
+                                'participants are actually simulated. It is '
+                                'only faster with `--engine python`: with the '
+                                '`numpy` engine, `force_dpoint_me` takes about '
+                                'as long. Use `benchmark_force_dpoint_fast.py` '
+                                'to see how far its estimates are from '
+                                '`force_dpoint_me`.')
+
     argparser.add_argument('--pop_multiplier',
                            metavar='pop_multiplier',
                            type=int,
@@ -280,9 +502,96 @@ def parse_command_line():
                                 'population size. Larger numbers will require '
                                 'more memory.')
 
+    argparser.add_argument('--dpa_run_length',
+                           metavar='dpa_run_length',
+                           type=int,
+                           default=DPA_DISTANCE,
+                           help='When `force_dpoint` is set: how many consecutive '
+                                'ms need to have significant t-tests for the '
+                                'population DPA to decide that the conditions '
+                                'diverged.')
+
+    argparser.add_argument('--dpa_threshold',
+                           metavar='dpa_threshold',
+                           type=float,
+                           default=TTEST_SIGNIFICANCE,
+                           help='When `force_dpoint` is set: the t-value above '
+                                'which a t-test is considered significant in the '
+                                'population DPA.')
+
+    argparser.add_argument('--dpa_sides',
+                           metavar='dpa_sides',
+                           type=str,
+                           default='one',
+                           choices=['one', 'two'],
+                           help='When `force_dpoint` is set: with "one", only '
+                                't-values above `dpa_threshold` (i.e., more looks '
+                                'to the Target) are significant. With "two", also '
+                                'the ones below `-dpa_threshold`.')
+
+    argparser.add_argument('--population_tolerance',
+                           metavar='population_tolerance',
+                           type=float,
+                           default=None,
+                           help='When `force_dpoint` is set: if set, the '
+                                'population is not of a fixed size. It is '
+                                'simulated in batches of `population_batch` '
+                                'participants, and the divergence points are '
+                                're-estimated after each batch. It stops when '
+                                'they moved at most this many ms (in every '
+                                'condition) since the previous batch, or when '
+                                'it reaches `n_subjs * pop_multiplier` '
+                                'participants. How many were simulated is '
+                                'recorded as `population_size`. (Not available '
+                                'with `force_dpoint_fast`)')
+
+    argparser.add_argument('--population_batch',
+                           metavar='population_batch',
+                           type=int,
+                           default=None,
+                           help='With `population_tolerance`: how many '
+                                'participants are simulated between two '
+                                'estimates of the divergence points. By default, '
+                                '`n_subjs`.')
+
+    argparser.add_argument('--population_cache',
+                           metavar='population_cache',
+                           type=str,
+                           default=None,
+                           help='When `force_dpoint` is set: a folder where the '
+                                'divergence points of the population are kept. '
+                                'If a previous run already measured them for the '
+                                'same parameters (i.e., everything that changes '
+                                'the population, including its size, '
+                                '`n_subjs * pop_multiplier`, and the `engine`, '
+                                'but not `rand_seed`), '
+                                'the population is not simulated at all, and '
+                                'only `n_subjs` participants are generated.')
+
+    argparser.add_argument('--population_cache_max_mb',
+                           metavar='population_cache_max_mb',
+                           type=float,
+                           default=100,
+                           help='When the `population_cache` folder gets larger '
+                                'than this, the entries that were used the '
+                                'longest ago are deleted.')
+
 
 
 
+    argparser.add_argument('--profile',
+                           default=False,
+                           action='store_true',
+                           help='If set, measures how long each stage of the '
+                                'program takes (generating participants, '
+                                'calculating the per ms looks, t-tests, finding '
+                                'the divergence point, shifting the trials and '
+                                'writing the output), how many rows per second it '
+                                'processes and how much memory it uses, and '
+                                'writes it into `<out_file>.profile.json`. '
+                                '(Measuring memory makes everything somewhat '
+                                'slower)')
+
     argparser.add_argument('--dump_per_trial_fixation_stats',
                            default=False,
                            action='store_true',
@@ -314,7 +623,34 @@ def parse_command_line():
     #                     default='spacy',
     #                     help='Which parser to use ("nltk" or "spacy")')
 
-    return argparser.parse_args()
+    args = argparser.parse_args(argv)
+    check_args(args, argparser.error)
+    return args
+
+def check_args(args, error):
+    # Calls `error` (which should raise) with what is wrong with `args`, if
+    # anything
+    if args.stream and args.out_format == 'feather':
+        error('`--stream` cannot be used with `--out_format feather`')
+    if args.writer_queue > 0 and not args.stream:
+        error('`--writer_queue` requires `--stream`')
+    if args.dpa_run_length < 1:
+        error('`--dpa_run_length` must be at least 1')
+    if args.population_tolerance is not None and args.force_dpoint_fast:
+        error('`--population_tolerance` cannot be used with `--force_dpoint_fast`')
+    if args.workers is not None and args.workers < 1:
+        error('`--workers` must be at least 1')
+    if args.population_batch is not None and args.population_batch < 1:
+        error('`--population_batch` must be at least 1')
+
+    if args.force_dpoint_fast:
+        # `force_dpoint_me` is (for now) always set by default
+        args.force_dpoint_me = False
+
+def is_forcing_dpoint(args):
+    # Whether the trials will be shifted to force the divergence point (in
+    # which case they are generated a bit longer, see `get_trial_window()`)
+    return args.force_dpoint or args.force_dpoint_me or args.force_dpoint_fast
 
 
 #####################################
@@ -403,11 +739,13 @@ def get_look_probs(trial_len,
 
 
 
-def get_events(trial_len):
+def get_events(trial_len, all_fixation_lengths=None):
     # I am using the word "event" here to denote (basically) the fixations.
     # The plan is to have an event happen every ~200ms (a typical fixation has
     # between 180ms and 250ms), and for it to be super rare for fixations to
     # happen immediately one after another.
+    # (the lengths of the fixations go into `all_fixation_lengths`, if given,
+    # for the stats)
     events = [False]*trial_len
     fixation_lengths = []
 
@@ -418,45 +756,11 @@ def get_events(trial_len):
         fixation_lengths.append(curr_fixation_len)
         idx += curr_fixation_len
 
-    all_fixation_lengths.append(fixation_lengths)
+    if all_fixation_lengths is not None:
+        all_fixation_lengths.append(fixation_lengths)
     return events
 
-def create_dataframe(looks, subj_id, trial_id, cond, args):
-    data = []
-
-    # If `args.force_dpoint` is set, we don't "trim" completely the
-    # beginning of the trial
-    trim_point = PRETRIAL_BUFFER - PRETRIAL_BUFFER_MARGIN \
-                    if args.force_dpoint or args.force_dpoint_me \
-                    else PRETRIAL_BUFFER
-
-    for idx,i in enumerate(looks[trim_point:]):
-        looking_target = True if i == 'Target' else False
-        looking_distractor = True if i == 'Distractor' else False
-
-        data.append((idx, 'Target', int(looking_target)))
-        data.append((idx, 'Distractor', int(looking_distractor)))
-
-    milliseconds, objs, is_looking = zip(*data)
-
-    trial_data = pd.DataFrame(data={
-        'participant': subj_id,
-        'condition': cond,
-        'trial': trial_id,
-        'time': milliseconds,
-        'object': objs,
-        'is_looking': is_looking
-    })
-
-    if args.force_dpoint or args.force_dpoint_me:
-        trial_data['time'] -= PRETRIAL_BUFFER_MARGIN
-
-    return trial_data
-
-
-def generate_trial_data(subj_id,
-                        trial_id,
-                        cond,
+def generate_trial_data(cond,
                         subj_per_trial_dp_var_sd,
                         subj_per_trial_bias_var_sd,
                         subj_per_trial_dspeed_var_sd,
@@ -468,10 +772,11 @@ def generate_trial_data(subj_id,
                         item_dpoint_bias,
                         item_prob_bias,
                         item_dspeed_bias,
-                        args):
+                        args,
+                        all_fixation_lengths=None):
     # We only care use `POSTTRIAL_BUFFER` if `force_dpoint` is set
     posttrial_buffer = POSTTRIAL_BUFFER \
-                        if args.force_dpoint or args.force_dpoint_me \
+                        if is_forcing_dpoint(args) \
                         else 0
 
     prob = get_look_probs(
@@ -492,42 +797,61 @@ def generate_trial_data(subj_id,
     )
 
     # The additional time (PRETRIAL_BUFFER) is so that we can treat better
-    # the trial beginning
-    looks = []
-    events = get_events(args.trial_len + PRETRIAL_BUFFER + posttrial_buffer)
-    curr_looking_at = random.random() < prob[0]
+    # the trial beginning.
+    # We return the fixations: the ms in which each of them starts (a
+    # fixation lasts until the next one starts) and the index in `OBJECTS` of
+    # the object being looked at.
+    onsets = []
+    fixated_objects = []
+    events = get_events(args.trial_len + PRETRIAL_BUFFER + posttrial_buffer, all_fixation_lengths)
+    # (There is always a fixation starting at ms 0, so this initial value is
+    # never used. We still draw it so that the random numbers stay the same)
+    curr_looking_at = LOOK_TARGET if random.random() < prob[0] else LOOK_DISTRACTOR
     for ms, e in enumerate(events):
         if e:
             # Let's see if the participant will look away from the monitor
             will_look_outmonitor = random.random() < args.outmonitor_look_prob + subj_outmonitor_look_bias
             if will_look_outmonitor:
-                curr_looking_at = 'Away'
+                curr_looking_at = LOOK_AWAY
             else:
-                curr_looking_at = 'Target' if random.random() < prob[ms] else 'Distractor'
-        looks.append(curr_looking_at)
-
-    trial_data = create_dataframe(looks, subj_id, trial_id, cond, args)
-
-    return trial_data
-
-def get_item_dpoint_bias(cond, trial):
-    if (cond, trial) not in item_dpoint_biases:
-        item_dpoint_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=args.item_dpoint_bias_sd))
-    return item_dpoint_biases[(cond, trial)]
-
-def get_item_dspeed_bias(cond, trial):
-    if (cond, trial) not in item_dspeed_biases:
-        item_dspeed_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=args.item_dspeed_bias_sd))
-    return item_dspeed_biases[(cond, trial)]
-
-def get_item_prob_bias(cond, trial):
-    if (cond, trial) not in item_prob_biases:
-        item_prob_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=args.item_prob_bias_sd))
-    return item_prob_biases[(cond, trial)]
-
-
-
-def generate_subj_data(subj_id, args):
+                curr_looking_at = LOOK_TARGET if random.random() < prob[ms] else LOOK_DISTRACTOR
+            onsets.append(ms)
+            fixated_objects.append(curr_looking_at)
+
+    return onsets, fixated_objects
+
+class DatasetState:
+    # What the participants of a dataset share (besides `args`): the item
+    # effects, drawn by the first participant that needs them, and (only for
+    # `--dump_*_fixation_stats`) the length of every fixation. Every dataset
+    # has its own (see `run()`), so nothing is left over between datasets
+    def __init__(self, args):
+        self.args = args
+        self.item_dpoint_biases = {}
+        self.item_dspeed_biases = {}
+        self.item_prob_biases = {}
+        self.fixation_lengths = [] \
+                                    if args.dump_per_trial_fixation_stats or args.dump_overall_fixation_stats \
+                                    else None
+
+    def get_item_dpoint_bias(self, cond, trial):
+        if (cond, trial) not in self.item_dpoint_biases:
+            self.item_dpoint_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=self.args.item_dpoint_bias_sd))
+        return self.item_dpoint_biases[(cond, trial)]
+
+    def get_item_dspeed_bias(self, cond, trial):
+        if (cond, trial) not in self.item_dspeed_biases:
+            self.item_dspeed_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=self.args.item_dspeed_bias_sd))
+        return self.item_dspeed_biases[(cond, trial)]
+
+    def get_item_prob_bias(self, cond, trial):
+        if (cond, trial) not in self.item_prob_biases:
+            self.item_prob_biases[(cond, trial)] = int(random.gauss(mu=0, sigma=self.args.item_prob_bias_sd))
+        return self.item_prob_biases[(cond, trial)]
+
+
+
+def generate_subj_data(args, state):
     n_conditions = args.n_conds
 
     # These influence variations that occur every trial
@@ -546,20 +870,16 @@ def generate_subj_data(subj_id, args):
     subj_dpoint_random_intercept = int(random.gauss(mu=0, sigma=args.subj_dpoint_rand_intercept_sd))
     subj_dpoint_random_slope = int(random.gauss(mu=0, sigma=args.subj_dpoint_rand_slope_sd))
 
-    # `subj_trials` is a list of data frames
+    # `subj_trials` is a list with the fixations of every trial
     subj_trials = []
     for cond in range(n_conditions):
         for trial in range(args.n_trials):
-            trial_id = "T" + str(trial)
-
-            item_dpoint_bias = get_item_dpoint_bias(cond, trial)
-            item_prob_bias = get_item_prob_bias(cond, trial)
-            item_dspeed_bias = get_item_dspeed_bias(cond, trial)
+            item_dpoint_bias = state.get_item_dpoint_bias(cond, trial)
+            item_prob_bias = state.get_item_prob_bias(cond, trial)
+            item_dspeed_bias = state.get_item_dspeed_bias(cond, trial)
 
             subj_trials.append(
                 generate_trial_data(
-                    subj_id,
-                    trial_id,
                     cond,
                     subj_per_trial_dp_var_sd,
                     subj_per_trial_bias_var_sd,
@@ -572,20 +892,928 @@ def generate_subj_data(subj_id, args):
                     item_dpoint_bias,
                     item_prob_bias,
                     item_dspeed_bias,
-                    args)
+                    args,
+                    state.fixation_lengths)
             )
-    return subj_trials
+    # The same arrays that the `numpy` engine produces
+    posttrial_buffer = POSTTRIAL_BUFFER \
+                        if is_forcing_dpoint(args) \
+                        else 0
+    return pad_fixations(subj_trials, args.trial_len + PRETRIAL_BUFFER + posttrial_buffer)
+
+def pad_fixations(trials, trial_len):
+    # `trials` is a list of (onsets, fixated_objects) lists. Turns it into the
+    # (onsets, fixated_objects) arrays (trials x max_n_fixations) that we use
+    # everywhere else. Missing fixations get an onset at `trial_len`
+    max_n_fixations = max(len(onsets) for onsets, _ in trials)
+    onsets = np.full((len(trials), max_n_fixations), trial_len, dtype=np.int64)
+    fixated_objects = np.zeros((len(trials), max_n_fixations), dtype=np.uint8)
+    for idx, (trial_onsets, trial_objects) in enumerate(trials):
+        onsets[idx, :len(trial_onsets)] = trial_onsets
+        fixated_objects[idx, :len(trial_objects)] = trial_objects
+    return onsets, fixated_objects
+
+def get_fixation_offsets(onsets, trial_len):
+    # A fixation ends (exclusive) when the next one starts, or at the end of
+    # the trial. Fixations that don't exist (onset >= `trial_len`) get
+    # onset == offset == `trial_len`
+    onsets = np.minimum(onsets, trial_len)
+    offsets = np.empty_like(onsets)
+    offsets[:, :-1] = onsets[:, 1:]
+    offsets[:, -1] = trial_len
+    return onsets, offsets
+
+def expand_fixations(fixations, trial_len):
+    # Turns the fixations (as returned by `generate_subj_data()`) into an
+    # array (trials x ms) with the index in `OBJECTS` of the object being
+    # looked at in every ms. (Every trial starts with a fixation at ms 0, so
+    # the durations of the fixations of every trial add up to `trial_len`)
+    onsets, fixated_objects = fixations
+    onsets, offsets = get_fixation_offsets(onsets, trial_len)
+    return np.repeat(fixated_objects.ravel(),
+                     (offsets - onsets).ravel()).reshape(len(onsets), trial_len)
 
+#####################################
+# The `numpy` engine.
+#
+# This does the same as `get_look_probs()`, `get_events()` and
+# `generate_trial_data()`, but for many trials at once: every trial is a row
+# of a 2D array (trials x ms). The functions below receive the per-trial
+# variables as arrays with one element per trial, so they work both for all
+# trials of a participant, and for the trials of many participants stacked
+# together.
+
+def sigmoid_batch(x, divisor):
+    # Same as `sigmoid()`, but `x` is an array and `divisor` (i.e.,
+    # `slow_factor + sum(rand_effect)`) can be an array that broadcasts with it.
+    #
+    # Here we can't choose the "version" of the sigmoid by looking at the sign
+    # of the divisor only once, so we use the trick of always exponentiating a
+    # negative number: with z = x/divisor,
+    #   z >= 0:  1 / (1 + e^-|z|)       (version B)
+    #   z <  0:  e^-|z| / (1 + e^-|z|)  (version A)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = x / divisor
+    exp_neg_abs_z = np.exp(-np.abs(z))
+    return np.where(z >= 0, 1, exp_neg_abs_z) / (1 + exp_neg_abs_z)
+
+def get_look_probs_batch(trial_len,
+                         pretrial_buffer,
+                         conds,
+                         subj_per_trial_dp_var_sd,
+                         subj_per_trial_bias_var_sd,
+                         subj_per_trial_dspeed_var_sd,
+                         subj_bias_toward_obj,
+                         subj_dspeed_bias,
+                         subj_dpoint_random_intercept,
+                         subj_dpoint_random_slope,
+                         item_dpoint_bias,
+                         item_prob_bias,
+                         item_dspeed_bias,
+                         args,
+                         rng,
+                         first_ms=0):
+    # `conds` and the `item_*` variables have one element per trial. The
+    # `subj_*` variables can either be scalars or also have one element per
+    # trial. Returns an array (trials x trial_len) of probabilities, or only
+    # its columns from `first_ms` on.
+    n_trials = len(conds)
+    condition_fixed_effect = conds * (args.cond_effect + subj_dpoint_random_slope)
+
+    # `random.gauss()` accepts negative SDs (the `subj_per_trial_*_sd` are
+    # themselves sampled around 0), but `rng.normal()` doesn't. So we scale
+    # standard normals instead. `np.trunc` does what `int()` does
+    random_dp_noise = np.trunc(rng.standard_normal(n_trials) * args.rand_dp_noise_sd)
+    random_prob_noise = rng.standard_normal(n_trials) * args.rand_prob_noise_sd
+    random_dspeed_noise = rng.standard_normal(n_trials) * args.rand_dspeed_noise_sd
+
+    subj_per_trial_dp_var = np.trunc(rng.standard_normal(n_trials) * subj_per_trial_dp_var_sd)
+    subj_per_trial_bias_var = np.trunc(rng.standard_normal(n_trials) * subj_per_trial_bias_var_sd)
+    subj_per_trial_dspeed_var = rng.standard_normal(n_trials) * subj_per_trial_dspeed_var_sd
 
-def generate_data(args):
-    n_subjects = args.n_subjs * args.pop_multiplier
-    print(" * will produce", n_subjects, "participants", end='')
+    divergence_moment = (
+            pretrial_buffer +
+            args.dpoint +
+            random_dp_noise +
+            condition_fixed_effect +
+            subj_dpoint_random_intercept +
+            subj_per_trial_dp_var +
+            item_dpoint_bias
+    ).astype(np.int64)
+
+    prob_bias = random_prob_noise + subj_per_trial_bias_var + subj_bias_toward_obj + item_prob_bias
+    divisor = (args.dspeed_slow_factor + random_dspeed_noise + subj_per_trial_dspeed_var +
+               subj_dspeed_bias + item_dspeed_bias)
+    if WARNINGS_ON and (divisor <= 0).any():
+        print("*-*-*-*-*")
+        print("WARNING: SIGMOID'S `DIVISOR` IS NEGATIVE IN",
+              (divisor <= 0).sum(), "OUT OF", n_trials, "TRIALS.")
+        print("You probably want to either increase `args.dspeed_slow_factor` or "
+              "decrease the other `dspeed` parameters.")
+        print("*-*-*-*-*")
+
+    # How many ms have passed since the divergence moment. (As in
+    # `get_look_probs()`, if the divergence moment is negative, the sigmoid
+    # still starts at the beginning of the trial)
+    ms_since_divergence = (np.arange(first_ms, trial_len)[np.newaxis, :] -
+                           np.maximum(divergence_moment, 0)[:, np.newaxis])
+    probs = np.where(ms_since_divergence < 0,
+                     0.5,
+                     sigmoid_batch(ms_since_divergence, divisor[:, np.newaxis]))
+    return probs + prob_bias[:, np.newaxis]
+
+def get_events_batch(n_trials, trial_len, rng, all_fixation_lengths=None):
+    # Returns the fixation onsets as an array (trials x max_n_fixations). Each
+    # row is sorted, and onsets >= `trial_len` are not real fixations (they're
+    # there just so that every row has the same length).
+
+    # Fixations are almost never shorter than MU-4*SD, so this is (almost
+    # always) enough columns. If it isn't, we add more below.
+    n_fixations = trial_len // (FIXATION_LEN_MU - 4*FIXATION_LEN_SD) + 1
+    fixation_lengths = np.trunc(
+        rng.normal(FIXATION_LEN_MU, FIXATION_LEN_SD, size=(n_trials, n_fixations)))
+    # A fixation with length <= 0 would never end
+    fixation_lengths = np.maximum(fixation_lengths, 1).astype(np.int64)
+    while fixation_lengths.sum(axis=1).min() < trial_len:
+        more_lengths = np.trunc(
+            rng.normal(FIXATION_LEN_MU, FIXATION_LEN_SD, size=(n_trials, n_fixations)))
+        fixation_lengths = np.concatenate(
+            [fixation_lengths, np.maximum(more_lengths, 1).astype(np.int64)], axis=1)
+
+    onsets = np.zeros_like(fixation_lengths)
+    onsets[:, 1:] = np.cumsum(fixation_lengths[:, :-1], axis=1)
+
+    # Same as `get_events()`: we keep the lengths of the fixations for stats
+    if all_fixation_lengths is not None:
+        is_fixation = onsets < trial_len
+        for lengths, valid in zip(fixation_lengths, is_fixation):
+            all_fixation_lengths.append(lengths[valid].tolist())
+    return onsets
+
+def generate_trials_batch(conds,
+                          subj_per_trial_dp_var_sd,
+                          subj_per_trial_bias_var_sd,
+                          subj_per_trial_dspeed_var_sd,
+                          subj_bias_toward_obj,
+                          subj_dspeed_bias,
+                          subj_outmonitor_look_bias,
+                          subj_dpoint_random_intercept,
+                          subj_dpoint_random_slope,
+                          item_dpoint_bias,
+                          item_prob_bias,
+                          item_dspeed_bias,
+                          args,
+                          rng,
+                          all_fixation_lengths=None):
+    # Same as `generate_trial_data()`, for many trials. Returns the fixations
+    # as arrays (trials x max_n_fixations): their onsets (see
+    # `get_events_batch()`) and the index in `OBJECTS` of the object looked at.
+    # This includes the pre- and post-trial buffers.
+    posttrial_buffer = POSTTRIAL_BUFFER \
+                        if is_forcing_dpoint(args) \
+                        else 0
+    trial_len = args.trial_len + PRETRIAL_BUFFER + posttrial_buffer
+
+    probs = get_look_probs_batch(
+        trial_len,
+        PRETRIAL_BUFFER,
+        conds,
+        subj_per_trial_dp_var_sd,
+        subj_per_trial_bias_var_sd,
+        subj_per_trial_dspeed_var_sd,
+        subj_bias_toward_obj,
+        subj_dspeed_bias,
+        subj_dpoint_random_intercept,
+        subj_dpoint_random_slope,
+        item_dpoint_bias,
+        item_prob_bias,
+        item_dspeed_bias,
+        args,
+        rng
+    )
+    onsets = get_events_batch(len(conds), trial_len, rng, all_fixation_lengths)
+
+    # Decide, for every fixation, what the participant will look at. The
+    # probability of looking at the target is the one at the fixation onset
+    will_look_outmonitor = rng.random(onsets.shape) < \
+                            args.outmonitor_look_prob + subj_outmonitor_look_bias
+    onset_probs = np.take_along_axis(probs, np.minimum(onsets, trial_len - 1), axis=1)
+    will_look_target = rng.random(onsets.shape) < onset_probs
+    fixated_objects = np.where(will_look_outmonitor, LOOK_AWAY,
+                               np.where(will_look_target, LOOK_TARGET, LOOK_DISTRACTOR))
+    return onsets, fixated_objects.astype(np.uint8)
+
+def draw_subj_vars_numpy(args, rng, state):
+    # The variables of a participant (and the item biases of each of their
+    # trials), named as the arguments of `generate_trials_batch()`
+    subj_per_trial_dp_var_sd = rng.normal(0, args.subj_per_trial_dpoint_var_sd)
+    subj_per_trial_bias_var_sd = rng.normal(0, args.subj_per_trial_bias_var_sd)
+    subj_per_trial_dspeed_var_sd = rng.normal(0, args.subj_per_trial_dspeed_var_sd)
+
+    subj_bias_toward_obj = rng.normal(0, args.subj_bias_var_sd)
+    subj_dspeed_bias = rng.normal(0, args.subj_dspeed_bias_var_sd)
+    subj_outmonitor_look_bias = rng.normal(0, args.subj_outmonitor_look_bias_sd)
+
+    subj_dpoint_random_intercept = int(rng.normal(0, args.subj_dpoint_rand_intercept_sd))
+    subj_dpoint_random_slope = int(rng.normal(0, args.subj_dpoint_rand_slope_sd))
+
+    # Same trial order as in `generate_subj_data()`. The item biases are shared
+    # with the `python` engine (and drawn in the same order)
+    conds = np.repeat(np.arange(args.n_conds), args.n_trials)
+    trials = np.tile(np.arange(args.n_trials), args.n_conds)
+    item_dpoint_bias = np.empty(len(conds))
+    item_prob_bias = np.empty(len(conds))
+    item_dspeed_bias = np.empty(len(conds))
+    for idx, (cond, trial) in enumerate(zip(conds.tolist(), trials.tolist())):
+        item_dpoint_bias[idx] = state.get_item_dpoint_bias(cond, trial)
+        item_prob_bias[idx] = state.get_item_prob_bias(cond, trial)
+        item_dspeed_bias[idx] = state.get_item_dspeed_bias(cond, trial)
+
+    return {
+        'conds': conds,
+        'subj_per_trial_dp_var_sd': subj_per_trial_dp_var_sd,
+        'subj_per_trial_bias_var_sd': subj_per_trial_bias_var_sd,
+        'subj_per_trial_dspeed_var_sd': subj_per_trial_dspeed_var_sd,
+        'subj_bias_toward_obj': subj_bias_toward_obj,
+        'subj_dspeed_bias': subj_dspeed_bias,
+        'subj_outmonitor_look_bias': subj_outmonitor_look_bias,
+        'subj_dpoint_random_intercept': subj_dpoint_random_intercept,
+        'subj_dpoint_random_slope': subj_dpoint_random_slope,
+        'item_dpoint_bias': item_dpoint_bias,
+        'item_prob_bias': item_prob_bias,
+        'item_dspeed_bias': item_dspeed_bias,
+    }
+
+def generate_subj_data_numpy(args, rng, state):
+    # Same as `generate_subj_data()`, but using the `numpy` engine
+    return generate_trials_batch(**draw_subj_vars_numpy(args, rng, state), args=args, rng=rng,
+                                 all_fixation_lengths=state.fixation_lengths)
+
+
+#####################################
+# `--workers`: every participant has its own random numbers, so they can be
+# generated in any order, by any process.
+
+def get_seed_sequence(args, *stream):
+    # The seed of a "stream" of random numbers: `(0,)` for the item effects,
+    # and `(1, subj)` for every participant
+    if args.rand_seed is None:
+        # (so that all streams come from the same, random, entropy)
+        args.rand_seed = str(random.getrandbits(64))
+    entropy = int.from_bytes(hashlib.sha256(str(args.rand_seed).encode()).digest(), 'little')
+    return np.random.SeedSequence(entropy, spawn_key=stream)
+
+def run_with_seed(seed_sequence, function, *function_args):
+    # The `python` engine draws everything from `random`, so we seed it for
+    # `function`, and then leave it as it was
+    state = random.getstate()
+    random.seed(int.from_bytes(seed_sequence.generate_state(4).tobytes(), 'little'))
+    try:
+        return function(*function_args)
+    finally:
+        random.setstate(state)
+
+def draw_item_biases(args, state):
+    # With `--workers`, the item effects are drawn before any participant
+    # (otherwise, they are drawn by the first participant who needs them)
+    def draw_all():
+        for cond in range(args.n_conds):
+            for trial in range(args.n_trials):
+                for item_biases in [state.item_dpoint_biases, state.item_prob_biases,
+                                    state.item_dspeed_biases]:
+                    item_biases.pop((cond, trial), None)
+                state.get_item_dpoint_bias(cond, trial)
+                state.get_item_prob_bias(cond, trial)
+                state.get_item_dspeed_bias(cond, trial)
+    run_with_seed(get_seed_sequence(args, 0), draw_all)
+
+def generate_seeded_subj(args, seed_sequence, state=None):
+    # A participant, generated with its own random numbers. (In the worker
+    # processes, `state` is the one given to `init_worker()`)
+    state = worker_state if state is None else state
+    if args.engine == 'numpy':
+        return generate_subj_data_numpy(args, np.random.default_rng(seed_sequence), state)
+    return run_with_seed(seed_sequence, generate_subj_data, args, state)
+
+def init_worker(state):
+    # Every worker process gets the item effects once (they don't change
+    # anymore). The fixation stats are not collected by the workers
+    global worker_state
+    worker_state = state
+    worker_state.fixation_lengths = None
+
+def generate_participants(args, n_subjects, state, rng=None):
+    # Yields the fixations of participants 0, 1, ... `n_subjects - 1`, in
+    # this order. Without `--workers`, they are generated here, one after the
+    # other, from `random` (or `rng`, for the `numpy` engine)
+    if args.workers is None:
+        for _ in range(n_subjects):
+            if args.engine == 'numpy':
+                yield generate_subj_data_numpy(args, rng, state)
+            else:
+                yield generate_subj_data(args, state)
+        return
+
+    draw_item_biases(args, state)
+    if args.workers == 1:
+        for subj in range(n_subjects):
+            yield generate_seeded_subj(args, get_seed_sequence(args, 1, subj), state)
+        return
+
+    # We only let the workers get a bit ahead of us, so that we don't keep too
+    # many participants in memory (and, with `population_tolerance`, don't
+    # generate too many that won't be needed)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers, initializer=init_worker, initargs=(state,)) as executor:
+        pending = collections.deque()
+        next_subj = 0
+        try:
+            for _ in range(n_subjects):
+                while next_subj < n_subjects and len(pending) < 2 * args.workers:
+                    pending.append(executor.submit(generate_seeded_subj, args,
+                                                   get_seed_sequence(args, 1, next_subj)))
+                    next_subj += 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
 
-    if args.force_dpoint_me:
-        selected_participants = random.sample(range(n_subjects), args.n_subjs)
 
-    # `all_data` is a list of data frames
-    all_data = []
+#####################################
+# The output data frame.
+#
+# We know beforehand how many rows the output will have, so instead of
+# creating a data frame per trial and concatenating them all, we fill
+# preallocated columns (with small integer types, and integer codes instead of
+# strings) and create a single data frame at the end.
+
+def get_trial_window(args):
+    # The length of the generated trials, and the ms at which we start keeping
+    # them. If `args.force_dpoint` is set, we don't "trim" completely the
+    # beginning of the trial (and the trials are a bit longer), so that they
+    # can be shifted later
+    force_dpoint = is_forcing_dpoint(args)
+    posttrial_buffer = POSTTRIAL_BUFFER if force_dpoint else 0
+    trim_point = PRETRIAL_BUFFER - PRETRIAL_BUFFER_MARGIN \
+                    if force_dpoint \
+                    else PRETRIAL_BUFFER
+    return args.trial_len + PRETRIAL_BUFFER + posttrial_buffer, trim_point
+
+def smallest_int_dtype(max_abs_value):
+    # The smallest signed integer type that fits +-`max_abs_value`
+    return np.min_scalar_type(-max_abs_value - 1)
+
+def get_kept_ms(args, time_offsets=None):
+    # Which ms of the generated trials of each condition are kept, and their
+    # `time`. Without `time_offsets`, that's everything from `trim_point` on
+    # (with `force_dpoint`, times start at `-PRETRIAL_BUFFER_MARGIN`). With
+    # them (see `get_time_offsets()`), the times of condition `c` are shifted
+    # by `-time_offsets[c]`, and only the ms in [0, `trial_len`) are kept
+    full_trial_len, trim_point = get_trial_window(args)
+    margin = PRETRIAL_BUFFER_MARGIN if is_forcing_dpoint(args) else 0
+    kept_ms = []
+    for cond in range(args.n_conds):
+        if time_offsets is None:
+            first, last = trim_point, full_trial_len
+            offset = 0
+        else:
+            offset = time_offsets[cond]
+            first = max(trim_point, trim_point + margin + offset)
+            last = min(full_trial_len, trim_point + margin + offset + args.trial_len)
+        milliseconds = np.arange(first, max(first, last))
+        kept_ms.append((milliseconds, milliseconds - trim_point - margin - offset))
+    return kept_ms
+
+class DatasetBuffer:
+    # With `time_offsets`, the trials are shifted and trimmed as they are added
+    # (see `get_kept_ms()`)
+    def __init__(self, n_subjs, args, time_offsets=None):
+        self.force_dpoint = is_forcing_dpoint(args)
+        self.full_trial_len, self.trim_point = get_trial_window(args)
+        self.n_ms = self.full_trial_len - self.trim_point
+        self.n_trials = args.n_trials
+        self.n_conds = args.n_conds
+        kept_ms = get_kept_ms(args, time_offsets)
+
+        # With the "long" layout, there are two rows (Target and Distractor)
+        # per ms. With the "wide" layout, a single row says what was looked at
+        self.wide = args.layout == 'wide'
+        rows_per_ms = 1 if self.wide else 2
+        self.rows_per_trial = rows_per_ms * self.n_ms
+        self.rows_per_subj = rows_per_ms * self.n_trials * sum(len(ms) for ms, _ in kept_ms)
+        n_rows = n_subjs * self.rows_per_subj
+
+        # (`time` may be shifted, so we leave it some room)
+        time_dtype = smallest_int_dtype(2 * (self.n_ms + PRETRIAL_BUFFER))
+        self.participant = np.empty(n_rows, dtype=smallest_int_dtype(n_subjs))
+        self.condition = np.empty(n_rows, dtype=smallest_int_dtype(self.n_conds))
+        self.trial = np.empty(n_rows, dtype=smallest_int_dtype(self.n_trials))
+        self.time = np.empty(n_rows, dtype=time_dtype)
+        self.object = np.empty(n_rows, dtype=np.int8)
+        self.is_looking = None if self.wide else np.empty(n_rows, dtype=np.int8)
+        # The index restarts at every trial (as it did when every trial was
+        # its own data frame)
+        self.index = np.empty(n_rows, dtype=smallest_int_dtype(self.rows_per_trial))
+
+        # The participant ids, in the order they were added. The codes in
+        # `self.participant` are indices into this list
+        self.participant_ids = []
+
+        # These are the same for every participant, so we compute them once.
+        # `subj_looks_idx` says where each kept ms is in the (trials x ms)
+        # array of looks of a participant. The index is still the one of the
+        # untrimmed trial
+        subj_condition, subj_trial, subj_time, subj_looks_idx, subj_index = [], [], [], [], []
+        for cond, (milliseconds, times) in enumerate(kept_ms):
+            for trial in range(self.n_trials):
+                trial_idx = cond * self.n_trials + trial
+                subj_condition.append(np.full(len(milliseconds), cond))
+                subj_trial.append(np.full(len(milliseconds), trial))
+                subj_time.append(times)
+                subj_looks_idx.append(trial_idx * self.full_trial_len + milliseconds)
+                subj_index.append(rows_per_ms * (milliseconds - self.trim_point))
+        self.subj_condition = np.repeat(np.concatenate(subj_condition), rows_per_ms)
+        self.subj_trial = np.repeat(np.concatenate(subj_trial), rows_per_ms)
+        self.subj_time = np.repeat(np.concatenate(subj_time), rows_per_ms)
+        self.subj_looks_idx = np.concatenate(subj_looks_idx)
+        self.subj_index = np.repeat(np.concatenate(subj_index), rows_per_ms)
+        if not self.wide:
+            self.subj_object = np.tile([LOOK_TARGET, LOOK_DISTRACTOR], self.rows_per_subj // 2)
+            self.subj_index[1::2] += 1
+
+    def add_subj(self, subj_id, fixations):
+        # `fixations` are as produced by `generate_subj_data()`. This is where
+        # we "expand" them into milliseconds
+        start = len(self.participant_ids) * self.rows_per_subj
+        end = start + self.rows_per_subj
+        looks = expand_fixations(fixations, self.full_trial_len).ravel()[self.subj_looks_idx]
+
+        self.participant[start:end] = len(self.participant_ids)
+        self.condition[start:end] = self.subj_condition
+        self.trial[start:end] = self.subj_trial
+        self.time[start:end] = self.subj_time
+        if self.wide:
+            self.object[start:end] = looks.ravel()
+        else:
+            self.object[start:end] = self.subj_object
+            is_looking = self.is_looking[start:end].reshape(-1, 2)
+            is_looking[:, 0] = (looks == LOOK_TARGET).ravel()
+            is_looking[:, 1] = (looks == LOOK_DISTRACTOR).ravel()
+        self.index[start:end] = self.subj_index
+
+        self.participant_ids.append(subj_id)
+
+    def to_dataframe(self):
+        n_rows = len(self.participant_ids) * self.rows_per_subj
+        data = {
+            'participant': pd.Categorical.from_codes(self.participant[:n_rows],
+                                                     categories=self.participant_ids),
+            'condition': self.condition[:n_rows],
+            'trial': pd.Categorical.from_codes(self.trial[:n_rows],
+                                               categories=["T" + str(i) for i in range(self.n_trials)]),
+            'time': self.time[:n_rows],
+        }
+        if self.wide:
+            data['fixated_object'] = pd.Categorical.from_codes(self.object[:n_rows],
+                                                               categories=OBJECTS)
+        else:
+            data['object'] = pd.Categorical.from_codes(self.object[:n_rows],
+                                                       categories=OBJECTS[:2])
+            data['is_looking'] = self.is_looking[:n_rows]
+        return pd.DataFrame(data=data, index=self.index[:n_rows], copy=False)
+
+class FixationReportBuffer:
+    # Same interface as `DatasetBuffer`, but for `--out_format fixations`: a
+    # data frame with one row per fixation. Times are in the same "unit" as
+    # the column `time` of `DatasetBuffer`.
+    # Here we don't know beforehand how many rows there will be, so we keep a
+    # list of arrays per participant.
+    # With `time_offsets`, the fixations are shifted and cut as in
+    # `DatasetBuffer`
+    def __init__(self, n_subjs, args, time_offsets=None):
+        self.force_dpoint = is_forcing_dpoint(args)
+        self.full_trial_len, self.trim_point = get_trial_window(args)
+        self.n_trials = args.n_trials
+        self.n_conds = args.n_conds
+        self.trial_len = args.trial_len
+        self.time_dtype = smallest_int_dtype(2 * (self.full_trial_len + PRETRIAL_BUFFER))
+        # (one offset per trial, i.e., per row of the fixations)
+        self.trial_offsets = None \
+                                if time_offsets is None \
+                                else np.repeat(time_offsets, self.n_trials)[:, np.newaxis]
+
+        self.participant_ids = []
+        self.columns = {'participant': [], 'condition': [], 'trial': [],
+                        'start': [], 'end': [], 'fixated_object': []}
+
+    def add_subj(self, subj_id, fixations):
+        onsets, fixated_objects = fixations
+        onsets, offsets = get_fixation_offsets(onsets, self.full_trial_len)
+
+        # Fixations that started before `trim_point` are cut, and the ones
+        # that don't exist (or are all before `trim_point`) are dropped
+        onsets = np.maximum(onsets, self.trim_point) - self.trim_point
+        offsets = np.maximum(offsets, self.trim_point) - self.trim_point
+        if self.force_dpoint:
+            onsets -= PRETRIAL_BUFFER_MARGIN
+            offsets -= PRETRIAL_BUFFER_MARGIN
+        if self.trial_offsets is not None:
+            onsets = np.maximum(onsets - self.trial_offsets, 0)
+            offsets = np.minimum(offsets - self.trial_offsets, self.trial_len)
+        rows, cols = np.nonzero(offsets > onsets)
+
+        # Rows are in the same order as in `generate_subj_data()`
+        self.columns['participant'].append(np.full(len(rows), len(self.participant_ids)))
+        self.columns['condition'].append(rows // self.n_trials)
+        self.columns['trial'].append(rows % self.n_trials)
+        self.columns['start'].append(onsets[rows, cols])
+        self.columns['end'].append(offsets[rows, cols])
+        self.columns['fixated_object'].append(fixated_objects[rows, cols])
+        self.participant_ids.append(subj_id)
+
+    def to_dataframe(self):
+        columns = {k: np.concatenate(v) for k, v in self.columns.items()}
+        start = columns['start'].astype(self.time_dtype)
+        end = columns['end'].astype(self.time_dtype)
+        return pd.DataFrame(data={
+            'participant': pd.Categorical.from_codes(columns['participant'],
+                                                     categories=self.participant_ids),
+            'condition': columns['condition'].astype(smallest_int_dtype(self.n_conds)),
+            'trial': pd.Categorical.from_codes(columns['trial'],
+                                               categories=["T" + str(i) for i in range(self.n_trials)]),
+            'start': start,
+            'end': end,
+            'duration': end - start,
+            'fixated_object': pd.Categorical.from_codes(columns['fixated_object'],
+                                                        categories=OBJECTS),
+        })
+
+def new_buffer(n_subjs, args, time_offsets=None):
+    # The buffer that produces the data frame for `args.out_format`
+    if args.out_format == 'fixations':
+        return FixationReportBuffer(n_subjs, args, time_offsets)
+    return DatasetBuffer(n_subjs, args, time_offsets)
+
+def fill_look_cube(cube, df):
+    # `cube` is an array (participants x conditions x trials x ms). Puts into
+    # it the index in `OBJECTS` of the object looked at in every row of `df`.
+    # Participants go in the order of the categories of `df['participant']`
+    participant = df['participant'].cat.remove_unused_categories().cat.codes.to_numpy()
+    condition = df['condition'].to_numpy()
+    trial = df['trial'].cat.codes.to_numpy()
+    time = df['time'].to_numpy()
+
+    if 'fixated_object' in df:
+        # With `--layout wide`, there's a single row per ms, with what we want
+        cube[participant, condition, trial, time] = df['fixated_object'].cat.codes.to_numpy()
+        return
+
+    # Every ms in `df` has a Target and a Distractor row. If neither of them
+    # is being looked at, the participant was looking away
+    cube[participant, condition, trial, time] = LOOK_AWAY
+    looking = df['is_looking'].to_numpy() == 1
+    cube[participant[looking], condition[looking], trial[looking], time[looking]] = \
+        df['object'].cat.codes.to_numpy()[looking]
+
+def write_cube_sidecar(out_file, participant_ids, args):
+    # The `npy` output has only numbers, so we put everything else in a .json
+    # (also written into a partial file first, see `get_partial_file()`)
+    sidecar_file = os.path.splitext(out_file)[0] + '.json'
+    partial_file = get_partial_file(sidecar_file)
+    with open(partial_file, 'w') as f:
+        json.dump({
+            'dimensions': ['participant', 'condition', 'trial', 'time'],
+            'participant': participant_ids,
+            'condition': list(range(args.n_conds)),
+            'trial': ["T" + str(i) for i in range(args.n_trials)],
+            'time_unit': 'ms',
+            'objects': dict(enumerate(OBJECTS)),
+            'missing': LOOK_MISSING,
+            'parameters': vars(args)
+        }, f, indent=2)
+    os.replace(partial_file, sidecar_file)
+
+def get_partial_file(out_file):
+    # Outputs are written into a hidden file next to `out_file` (unique to
+    # this process), and only moved into `out_file` (which is atomic) once
+    # they are complete, so that `out_file` is never half written.
+    # (`run_generator.py --resume` deletes the ones left by crashed runs)
+    folder, name = os.path.split(out_file)
+    return os.path.join(folder, '.{}.{}{}'.format(name, os.getpid(), PARTIAL_SUFFIX))
+
+def open_output(out_file, compression, name=None):
+    # Opens `out_file` for writing bytes, compressing them if asked to.
+    # `name` is the name the file will end up with, if not `out_file` (gzip
+    # keeps it in the file, see `get_partial_file()`)
+    if compression == 'gzip':
+        # (level 6 is the default of the `gzip` program. Python's default, 9,
+        # is much slower and produces files that are only slightly smaller)
+        f = gzip.GzipFile(filename=name or out_file, mode='wb', compresslevel=6,
+                          fileobj=open(out_file, 'wb'))
+        # (so that closing `f` also closes the file, as `gzip.open()` does)
+        f.myfileobj = f.fileobj
+        return f
+    if compression == 'zstd':
+        import zstandard    # requires `pip install zstandard`
+        return zstandard.ZstdCompressor().stream_writer(open(out_file, 'wb'))
+    return open(out_file, 'wb')
+
+def get_csv_field(values):
+    # All our columns are either categorical or integers with a small range,
+    # so every value is one of a few strings. Returns these strings, as
+    # a table of bytes (n_strings x max_len, padded with zeros) plus a mask
+    # of which of these bytes are real, and the index in this table of every
+    # value in `values`
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        strings = [str(i) for i in values.cat.categories]
+        codes = values.cat.codes.to_numpy()
+    else:
+        values = np.asarray(values, dtype=np.int64)
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        if high - low < 2**20:
+            strings = [str(i) for i in range(low, high + 1)]
+            codes = values - low
+        else:
+            unique_values, codes = np.unique(values, return_inverse=True)
+            strings = [str(i) for i in unique_values]
+
+    encoded = [i.encode() for i in strings]
+    lengths = np.array([len(i) for i in encoded])
+    table = np.zeros((len(encoded), max(lengths)), dtype=np.uint8)
+    for idx, i in enumerate(encoded):
+        table[idx, :len(i)] = np.frombuffer(i, dtype=np.uint8)
+    mask = np.arange(table.shape[1])[np.newaxis, :] < lengths[:, np.newaxis]
+    return table, mask, codes
+
+def write_csv(df, out_file, header=True, index=True, chunk_size=2**18):
+    # Writes `df` into `out_file` (a file opened for bytes) exactly as
+    # `df.to_csv(out_file, header=header, index=index)` would, but much faster.
+    # It only works with our columns (categorical or integers).
+    #
+    # Every row is put together as a fixed-width array of bytes, where each
+    # value is copied from the table of `get_csv_field()`. Then we drop the
+    # padding with a mask, and what is left is the csv text.
+    columns = ([df.index] if index else []) + [df[i] for i in df.columns]
+    if header:
+        names = ([''] if index else []) + list(df.columns)
+        out_file.write((','.join(names) + os.linesep).encode())
+
+    fields = [get_csv_field(i) for i in columns]
+    comma = np.frombuffer(b',', dtype=np.uint8)
+    line_end = np.frombuffer(os.linesep.encode(), dtype=np.uint8)
+    for start in range(0, len(df), chunk_size):
+        end = min(start + chunk_size, len(df))
+        pieces = []
+        masks = []
+        for idx, (table, mask, codes) in enumerate(fields):
+            separator = comma if idx < len(fields) - 1 else line_end
+            pieces.extend([table[codes[start:end]],
+                           np.broadcast_to(separator, (end - start, len(separator)))])
+            masks.extend([mask[codes[start:end]],
+                          np.ones((end - start, len(separator)), dtype=bool)])
+        out_file.write(np.hstack(pieces)[np.hstack(masks)].tobytes())
+
+def write_dataframe(df, args, out_file=None):
+    # (`out_file` is where the data goes, if not `args.out_file`)
+    out_file = out_file or args.out_file
+    if args.out_format == 'parquet':
+        # requires `pip install pyarrow`
+        # (the categorical columns become dictionary-encoded columns)
+        df.to_parquet(out_file, index=False)
+    elif args.out_format == 'feather':
+        # requires `pip install pyarrow`
+        # (feather only accepts the default index, which we don't need anyway)
+        df.reset_index(drop=True).to_feather(out_file)
+    elif args.out_format == 'fixations':
+        # Like the fixation reports of eye-trackers, without an index
+        with open_output(out_file, args.compression, args.out_file) as f:
+            write_csv(df, f, index=False)
+    elif args.out_format == 'npy':
+        participant_ids = df['participant'].cat.remove_unused_categories().cat.categories.tolist()
+        cube = np.full((len(participant_ids), args.n_conds, args.n_trials, args.trial_len),
+                       LOOK_MISSING, dtype=np.uint8)
+        fill_look_cube(cube, df)
+        # (`np.save()` would add ".npy" to the file name if it isn't there)
+        with open(out_file, 'wb') as f:
+            np.save(f, cube)
+        write_cube_sidecar(args.out_file, participant_ids, args)
+    else:
+        with open_output(out_file, args.compression, args.out_file) as f:
+            write_csv(df, f)
+
+class CSVStream:
+    # Same interface as `DatasetBuffer`, but every participant goes into
+    # `out_file` as soon as it is added
+    def __init__(self, out_file, args):
+        self.out_file = open_output(out_file, args.compression, args.out_file)
+        self.args = args
+        self.write_header = True
+
+    def write(self, df):
+        write_csv(df, self.out_file, header=self.write_header,
+                  index=self.args.out_format != 'fixations')
+        self.write_header = False
+
+    def add_subj(self, subj_id, fixations):
+        subj_data = new_buffer(1, self.args)
+        subj_data.add_subj(subj_id, fixations)
+        self.write(subj_data.to_dataframe())
+
+    def close(self):
+        self.out_file.close()
+
+class ParquetStream(CSVStream):
+    # Same as `CSVStream`, but every participant becomes a "row group" of a
+    # parquet file
+    def __init__(self, out_file, args):
+        self.out_file = out_file
+        self.args = args
+        self.writer = None
+
+    def write(self, df):
+        # requires `pip install pyarrow`
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.out_file, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class CubeStream(CSVStream):
+    # Same as `CSVStream`, but for the `npy` output. The file is memory-mapped,
+    # and every participant is written into its own slice of it
+    def __init__(self, out_file, args):
+        self.out_file = out_file
+        self.args = args
+        self.participant_ids = []
+        # When streaming, we always end up with `args.n_subjs` participants
+        self.cube = np.lib.format.open_memmap(
+            out_file, mode='w+', dtype=np.uint8,
+            shape=(args.n_subjs, args.n_conds, args.n_trials, args.trial_len))
+
+    def write(self, df):
+        subj_idx = len(self.participant_ids)
+        self.cube[subj_idx] = LOOK_MISSING
+        fill_look_cube(self.cube[subj_idx:subj_idx+1], df)
+        self.participant_ids.extend(
+            df['participant'].cat.remove_unused_categories().cat.categories.tolist())
+
+    def close(self):
+        self.cube.flush()
+        del self.cube
+        write_cube_sidecar(self.args.out_file, self.participant_ids, self.args)
+
+class BackgroundStream:
+    # Wraps one of the streams above, so that whatever is added to it gets
+    # written by a background thread. The thread takes the participants from
+    # a queue of at most `queue_size` elements (so, if generating is faster
+    # than writing, we wait instead of piling participants up in memory)
+    def __init__(self, stream, queue_size):
+        self.stream = stream
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+
+        # For the report in `close()`
+        self.writing_time = 0
+        self.waiting_time = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Something went wrong. Just empty the queue
+                continue
+            method, method_args = item
+            start = time.perf_counter()
+            try:
+                getattr(self.stream, method)(*method_args)
+            except Exception as e:
+                self.error = e
+            self.writing_time += time.perf_counter() - start
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        start = time.perf_counter()
+        self.queue.put(item)
+        self.waiting_time += time.perf_counter() - start
+
+    def write(self, df):
+        self.put(('write', (df,)))
+
+    def add_subj(self, subj_id, fixations):
+        self.put(('add_subj', (subj_id, fixations)))
+
+    def close(self):
+        self.put(None)
+        start = time.perf_counter()
+        self.thread.join()
+        self.waiting_time += time.perf_counter() - start
+        if self.error is not None:
+            raise self.error
+        self.stream.close()
+
+        # Whatever time the writer spent writing, but we didn't spend waiting
+        # for it, happened while we were generating participants
+        print(" * background writer: {:.2f}s writing, {:.2f}s waiting for it "
+              "(saved {:.2f}s)".format(self.writing_time, self.waiting_time,
+                                       max(self.writing_time - self.waiting_time, 0)))
+
+def open_stream(args, out_file=None):
+    # (`out_file` is where the data goes, if not `args.out_file`)
+    out_file = out_file or args.out_file
+    if args.out_format == 'parquet':
+        stream = ParquetStream(out_file, args)
+    elif args.out_format == 'npy':
+        stream = CubeStream(out_file, args)
+    else:
+        stream = CSVStream(out_file, args)
+
+    if args.writer_queue > 0:
+        return BackgroundStream(stream, args.writer_queue)
+    return stream
+
+class LooksBuffer:
+    # Same interface as `DatasetBuffer`, but only keeps the fixations of
+    # every participant, which are much smaller than the data frame. Used
+    # when forcing the divergence point, since the participants can only be
+    # turned into rows after the divergence point is known
+    # With `force_dpoint_me`, `population_looks` (a `TTestAccumulator`) has
+    # the looks of the whole population (see `generate_data()`)
+    def __init__(self):
+        self.subj_ids = []
+        self.fixations = []
+        self.population_looks = None
+
+    def add_subj(self, subj_id, fixations):
+        self.subj_ids.append(subj_id)
+        self.fixations.append(fixations)
+
+
+def generate_data(args, state, all_data=None, simulate_population=True):
+    # `all_data` receives the participants that are kept (see `DatasetBuffer`,
+    # `CSVStream` and `LooksBuffer`). By default, it is a `DatasetBuffer` (or
+    # a `FixationReportBuffer`). Returns `all_data`. `state` is the
+    # `DatasetState` of the dataset.
+    # Without `simulate_population` (with `force_dpoint_fast`, or when the
+    # divergence points are in the `population_cache`), only `n_subjs`
+    # participants are generated
+    n_subjects = args.n_subjs * args.pop_multiplier \
+                    if simulate_population \
+                    else args.n_subjs
+    sample_population = args.force_dpoint_me and simulate_population
+    # With `population_tolerance`, `n_subjects` is only the maximum (see
+    # `is_population_stable()`)
+    adaptive = sample_population and args.population_tolerance is not None
+    print(" * will produce", ("up to " if adaptive else "") + str(n_subjects),
+          "participants", end='')
+
+    if adaptive:
+        # We don't know how many participants there will be, so the sampled
+        # ones are kept with "reservoir sampling": the first `n_subjs`, and
+        # then every participant `subj` replaces one of them with probability
+        # `n_subjs / (subj + 1)`. Each is (subj, subj_id, subj_trials)
+        reservoir = []
+        batch_size = args.population_batch or args.n_subjs
+        previous_points = None
+    elif sample_population:
+        # (a set, since we check every participant against it)
+        selected_participants = set(random.sample(range(n_subjects), args.n_subjs))
+
+    # The `numpy` engine has its own random number generator. We seed it from
+    # `random` so that `rand_seed` still makes the whole run reproducible.
+    # (With `--workers`, every participant has its own, see
+    # `generate_participants()`)
+    rng = None
+    if args.engine == 'numpy' and args.workers is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    participants = generate_participants(args, n_subjects, state, rng)
+
+    # With `force_dpoint_me`, we only keep the sampled participants
+    if all_data is None:
+        n_kept_subjects = args.n_subjs if sample_population else n_subjects
+        all_data = new_buffer(n_kept_subjects, args)
+
+    # With `force_dpoint_me`, the t-tests of the population are accumulated as
+    # we go (`all_data` is then a `LooksBuffer`)
+    if sample_population:
+        full_trial_len, trim_point = get_trial_window(args)
+        population_looks = TTestAccumulator(args.n_conds, full_trial_len - trim_point)
+        all_data.population_looks = population_looks
+
+    # For `--profile`: how many ms we simulate per participant
+    subj_ms = args.n_conds * args.n_trials * get_trial_window(args)[0]
+
+    n_simulated = 0
     for subj in range(n_subjects):
         # Some quality of life:
         # Will show a dot per participant, and the value of `subj` every 50 dots
@@ -595,24 +1823,80 @@ def generate_data(args):
 
         subj_id = "P" + str(subj)
         # Define other variables
-        subj_trials = generate_subj_data(subj_id, args)
+        with profiler.stage('subject generation', rows=subj_ms, rows_unit='trial ms'):
+            subj_trials = next(participants)
+        n_simulated += 1
+
+        # The participants that are not sampled only contribute their per ms
+        # looks to the population t-tests, so we never turn them into rows.
+        # (We still generate them, so that the random numbers drawn for the
+        # sampled participants are the same)
+        if sample_population:
+            with profiler.stage('per-ms aggregation', rows=subj_ms, rows_unit='trial ms'):
+                population_looks.add(get_subj_target_looks(subj_trials, args))
+
+            if adaptive:
+                if subj < args.n_subjs:
+                    reservoir.append((subj, subj_id, subj_trials))
+                else:
+                    replaced = random.randrange(subj + 1)
+                    if replaced < args.n_subjs:
+                        reservoir[replaced] = (subj, subj_id, subj_trials)
+                del subj_trials
 
-        if args.force_dpoint_me:
-            subj_per_ms_looks = get_per_ms_looks(pd.concat(subj_trials, axis=0))
-            all_subjs_per_ms_looks.append(subj_per_ms_looks)
-            del subj_per_ms_looks
+                # At the end of every batch, we check whether the population
+                # is large enough already
+                if n_simulated >= args.n_subjs and n_simulated % batch_size == 0:
+                    points = find_divergence_point_using_ttests(population_looks.to_dataframe(),
+                                                                args.dpa_run_length,
+                                                                args.dpa_threshold,
+                                                                args.dpa_sides == 'two',
+                                                                warn=False)
+                    if is_population_stable(previous_points, points, args.population_tolerance):
+                        break
+                    previous_points = points
+                continue
 
             if subj not in selected_participants:
                 del subj_trials
                 continue
 
-        all_data.extend(subj_trials)
-
-    return pd.concat(all_data, axis=0)
+        # (when streaming, this is also where the participant gets written)
+        with profiler.stage('buffering', rows=subj_ms, rows_unit='trial ms'):
+            all_data.add_subj(subj_id, subj_trials)
+
+    # (stops the `--workers`, if we stopped early)
+    participants.close()
+
+    # The participants actually simulated (which, with `population_tolerance`,
+    # can be fewer than `n_subjects`). It ends up in the `.json` of the `npy`
+    # output and in the `.profile.json`
+    args.population_size = n_simulated
+    print()
+    print(" * produced", args.population_size, "participants")
+
+    if adaptive:
+        # (in the same order as they were generated)
+        for _, subj_id, subj_trials in sorted(reservoir, key=lambda kept: kept[0]):
+            with profiler.stage('buffering', rows=subj_ms, rows_unit='trial ms'):
+                all_data.add_subj(subj_id, subj_trials)
+
+    return all_data
+
+def is_population_stable(previous_points, points, tolerance):
+    # Whether the divergence points of every condition moved at most
+    # `tolerance` ms since the previous batch (`previous_points` is None after
+    # the first batch). If a condition has no divergence point yet, the
+    # population is still too small
+    if previous_points is None:
+        return False
+    return all(points[cond] is not None and previous_points[cond] is not None
+               and abs(points[cond] - previous_points[cond]) <= tolerance
+               for cond in points)
 
 #####################################
 
-def per_trial_fixation_stats():
+def per_trial_fixation_stats(all_fixation_lengths):
     maxes = []
     mins = []
     means = []
@@ -647,7 +1931,7 @@ def per_trial_fixation_stats():
     return df
 
 
-def overall_fixation_stats(out_folder):
+def overall_fixation_stats(all_fixation_lengths, out_folder):
     # I know this is unreadable. Look here: https://stackoverflow.com/a/952952
     all_fixations = [i for j in all_fixation_lengths for i in j]
 
@@ -676,6 +1960,15 @@ def overall_fixation_stats(out_folder):
 #####################################
 
 def get_per_ms_looks(df):
+    if 'fixated_object' in df:
+        # With `--layout wide`, we can just check whether the Target was looked
+        # at in each row (which is the same as what we do below)
+        df = pd.DataFrame({'participant': df['participant'],
+                           'time': df['time'],
+                           'condition': df['condition'],
+                           'object': 'Target',
+                           'is_looking': (df['fixated_object'] == 'Target').astype(int)})
+
     # For the calculations below, we will only consider the looks to the Target
     no_distractor = df.loc[df['object'] != 'Distractor']
     no_distractor_nor_aways = no_distractor.loc[no_distractor['object'] != 'Away']
@@ -683,8 +1976,8 @@ def get_per_ms_looks(df):
 
     # This will give us the mean `looks` for each combination of
     # (participant, time, condition)
-    per_ms_looks = no_distractor_nor_aways.groupby(['participant', 'time', 'condition']).apply(
-        lambda x: x['is_looking'].mean())
+    per_ms_looks = no_distractor_nor_aways.groupby(['participant', 'time', 'condition'],
+                                                   observed=True)['is_looking'].mean()
 
     # `per_ms_looks` is a Series, which I dislike. Let's make it a Data Frame
     per_ms_looks_df = pd.DataFrame({'participant': per_ms_looks.index.get_level_values(0),
@@ -695,95 +1988,406 @@ def get_per_ms_looks(df):
     return per_ms_looks_df
 
 
-def run_ttests(df, args):
-    per_ms_looks_df = pd.concat(all_subjs_per_ms_looks, axis=0) \
-                        if args.force_dpoint_me \
-                        else get_per_ms_looks(df)
-
-    # Now we calculate, for each pair (time, condition), the t-test over all participant means
-    ttests = per_ms_looks_df.groupby(['time', 'condition']).apply(
-        lambda x: stats.ttest_1samp(x['mean_looks'],
-                                    popmean=0.5).statistic)
-
-    # `ttests` is a Series, which I dislike. Let's make it a Data Frame
-    ttests_df = pd.DataFrame({'time': ttests.index.get_level_values(0),
-                              'condition': ttests.index.get_level_values(1),
-                              'tvalue': ttests.values})
-
-    return per_ms_looks_df, ttests_df
+def get_subj_target_looks(fixations, args):
+    # Same as `get_per_ms_looks()`, but for a single participant, and straight
+    # from the fixations (without "expanding" them into a data frame): returns
+    # an array (conditions x ms) with the proportion of trials in which the
+    # Target was being looked at in each ms. The ms are the ones kept by
+    # `DatasetBuffer` (i.e., ms 0 is `-PRETRIAL_BUFFER_MARGIN`)
+    full_trial_len, trim_point = get_trial_window(args)
+    onsets, offsets = get_fixation_offsets(fixations[0], full_trial_len)
+    is_target = fixations[1] == LOOK_TARGET
+    conds = np.broadcast_to(np.repeat(np.arange(args.n_conds), args.n_trials)[:, None],
+                            onsets.shape)
+
+    # Every look to the Target adds 1 when it starts and removes it when it
+    # ends. The cumulative sum is then how many trials were looking at the
+    # Target in each ms. (The "missing" fixations at the end of the trials
+    # start and end at the same ms, so they cancel out)
+    changes = np.zeros((args.n_conds, full_trial_len + 1), dtype=np.int64)
+    np.add.at(changes, (conds[is_target], onsets[is_target]), 1)
+    np.add.at(changes, (conds[is_target], offsets[is_target]), -1)
+    looks = np.cumsum(changes[:, trim_point:full_trial_len], axis=1) \
+            + changes[:, :trim_point].sum(axis=1, keepdims=True)
+    return looks / args.n_trials
+
+class TTestAccumulator:
+    # Keeps the running mean and variance (with Welford's algorithm) of the
+    # arrays of `get_subj_target_looks()` of every participant added to it.
+    # This way we can do the t-tests of the whole population without keeping
+    # every participant in memory
+    def __init__(self, n_conds, n_ms):
+        self.count = 0
+        self.mean = np.zeros((n_conds, n_ms))
+        self.m2 = np.zeros((n_conds, n_ms))
+
+    def add(self, subj_looks):
+        self.count += 1
+        delta = subj_looks - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (subj_looks - self.mean)
+
+    def tvalues(self, popmean=0.5):
+        return get_tvalues(self.mean, self.m2 / (self.count - 1), self.count, popmean)
+
+    def to_dataframe(self, popmean=0.5):
+        # Same as the `ttests_df` of `run_ttests()`
+        n_conds, n_ms = self.mean.shape
+        return tvalues_to_dataframe(self.tvalues(popmean).T,
+                                    np.arange(n_ms) - PRETRIAL_BUFFER_MARGIN,
+                                    np.arange(n_conds))
+
+def get_tvalues(mean, var, count, popmean=0.5):
+    # One sample t-test, as in `scipy.stats.ttest_1samp()`. `var` is the
+    # sample variance (i.e., with `ddof=1`). Gives inf if the variance is 0 (or
+    # nan if also the mean is `popmean`), as scipy does
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (mean - popmean) / np.sqrt(var / count)
+
+def ttest_1samp_matrix(looks, popmean=0.5):
+    # All t-tests at once: `looks` is an array (participants x ...), and the
+    # t-tests are over the participants
+    return get_tvalues(looks.mean(axis=0), looks.var(axis=0, ddof=1),
+                       len(looks), popmean)
+
+def tvalues_to_dataframe(tvalues, times, conds):
+    # `tvalues` is an array (ms x conditions)
+    return pd.DataFrame({'time': np.repeat(times, len(conds)),
+                         'condition': np.tile(conds, len(times)),
+                         'tvalue': tvalues.ravel()})
+
+def run_ttests(looks_buffer, args):
+    if args.force_dpoint_me:
+        # The t-tests were accumulated while generating the participants. We
+        # don't have the per participant means anymore
+        return None, looks_buffer.population_looks.to_dataframe()
+
+    # `looks_buffer` (a `LooksBuffer`) has the whole population. For each
+    # pair (time, condition), the t-test is over all participant means
+    looks = np.stack([get_subj_target_looks(fixations, args)
+                      for fixations in looks_buffer.fixations])
+    # (we don't build the per ms data frame here either)
+    return None, tvalues_to_dataframe(ttest_1samp_matrix(looks).T,
+                                      np.arange(looks.shape[2]) - PRETRIAL_BUFFER_MARGIN,
+                                      np.arange(args.n_conds))
+
+def get_fixation_age_weights():
+    # For `force_dpoint_fast`: the probability that, at a random ms, the
+    # current fixation started `a` ms ago (i.e., P(length > a) / mean length).
+    # The lengths are as in `get_events()`: `int(gauss(MU, SD))`, at least 1
+    max_len = FIXATION_LEN_MU + 6 * FIXATION_LEN_SD
+    ages = np.arange(max_len)
+    # P(length > a) = P(gauss >= a + 1). (We don't need scipy for the normal CDF)
+    longer_than = np.array([0.5 * math.erfc((a + 1 - FIXATION_LEN_MU) / (FIXATION_LEN_SD * math.sqrt(2)))
+                            for a in ages])
+    longer_than[0] = 1
+    return longer_than / longer_than.sum()
+
+def get_fft_len(min_len):
+    # The smallest length >= `min_len` with no prime factors other than 2, 3
+    # and 5 (FFTs of these lengths are much faster)
+    fft_len = min_len
+    while True:
+        rest = fft_len
+        for factor in [2, 3, 5]:
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return fft_len
+        fft_len += 1
+
+def smooth_by_fixation_age(curves, age_weights, start):
+    # For `force_dpoint_fast`: each fixation looks at the Target with the
+    # probability at its onset, so the probability that the Target is being
+    # looked at in a given ms is the probability curve "smoothed" by the age
+    # of the current fixation. `curves` has one curve per row, and we return
+    # them from ms `start` on. (Before the start of the trial, we use the first
+    # value.) The convolution is done with FFTs, all rows at once, and only
+    # over the ms that affect the ms from `start` on
+    n_ages = len(age_weights)
+    first = start - n_ages
+    curves = curves[:, max(first, 0):]
+    if first < 0:
+        curves = np.concatenate([np.repeat(curves[:, :1], -first, axis=1), curves], axis=1)
+    fft_len = get_fft_len(curves.shape[1] + n_ages)
+    return np.fft.irfft(np.fft.rfft(curves, fft_len) * np.fft.rfft(age_weights, fft_len),
+                        fft_len)[:, n_ages:curves.shape[1]]
+
+def estimate_population_ttests(args, state):
+    # For `force_dpoint_fast`: estimates the `ttests_df` that `run_ttests()`
+    # would produce for a population of `n_subjs * pop_multiplier`, without
+    # simulating any fixation. For every participant, we only draw the
+    # probability curves of their trials (always with the `numpy` engine, and
+    # for a batch of participants at once).
+    # The mean look to the Target of a participant is the (smoothed) mean of
+    # these curves. Its variance also has the variance of the looks "inside"
+    # each trial (they are Bernoulli): the sum of e*(1-e) over the trials,
+    # which is n*mean*(1-mean) minus the dispersion of the trials around their
+    # mean. (Smoothing the dispersion instead of every trial overestimates
+    # it a bit, but saves an FFT per trial)
+    rng = np.random.default_rng(random.getrandbits(64))
+    full_trial_len, trim_point = get_trial_window(args)
+    n_ms = full_trial_len - trim_point
+    age_weights = get_fixation_age_weights()
 
-def find_divergence_point_using_ttests(ttests_df):
+    n_subjects = args.n_subjs * args.pop_multiplier
+    means = TTestAccumulator(args.n_conds, n_ms)
+    within_var = np.zeros((args.n_conds, n_ms))
+    # (the smoothing doesn't need the ms before `first_ms`)
+    first_ms = max(trim_point - len(age_weights), 0)
+    n_drawn_ms = full_trial_len - first_ms
+    batch_size = max(ESTIMATE_BATCH_PROBS // (args.n_conds * args.n_trials * n_drawn_ms), 1)
+    for first_subj in range(0, n_subjects, batch_size):
+        batch = [draw_subj_vars_numpy(args, rng, state)
+                 for _ in range(min(batch_size, n_subjects - first_subj))]
+        outmonitor_look_prob = args.outmonitor_look_prob + np.array(
+            [subj_vars.pop('subj_outmonitor_look_bias') for subj_vars in batch])
+        looks_factor = (1 - np.clip(outmonitor_look_prob, 0, 1))[:, np.newaxis, np.newaxis]
+        # The trials of all participants of the batch stacked together (the
+        # participants' own variables are repeated for each of their trials)
+        n_subj_trials = args.n_conds * args.n_trials
+        stacked_vars = {name: np.concatenate([np.broadcast_to(subj_vars[name], n_subj_trials)
+                                              for subj_vars in batch])
+                        for name in batch[0]}
+        probs = get_look_probs_batch(full_trial_len, PRETRIAL_BUFFER, **stacked_vars,
+                                     args=args, rng=rng, first_ms=first_ms)
+        probs = np.clip(probs, 0, 1).reshape(len(batch), args.n_conds, args.n_trials, n_drawn_ms)
+        mean_probs = probs.mean(axis=2)
+        dispersion = ((probs - mean_probs[:, :, np.newaxis, :])**2).sum(axis=2)
+
+        # (`smooth_by_fixation_age()` wants one curve per row)
+        looks = smooth_by_fixation_age(mean_probs.reshape(-1, n_drawn_ms), age_weights, trim_point - first_ms)
+        looks = np.clip(looks.reshape(len(batch), args.n_conds, n_ms), 0, 1) * looks_factor
+        dispersion = smooth_by_fixation_age(dispersion.reshape(-1, n_drawn_ms), age_weights,
+                                            trim_point - first_ms)
+        dispersion = dispersion.reshape(len(batch), args.n_conds, n_ms) * looks_factor**2
+        for subj_looks in looks:
+            means.add(subj_looks)
+        within_var += (np.maximum(args.n_trials * looks * (1 - looks) - dispersion, 0)
+                       / args.n_trials**2).sum(axis=0)
+
+    var = means.m2 / (n_subjects - 1) + within_var / n_subjects
+    return tvalues_to_dataframe(get_tvalues(means.mean, var, n_subjects).T,
+                                np.arange(n_ms) - PRETRIAL_BUFFER_MARGIN,
+                                np.arange(args.n_conds))
+
+def find_first_run(significant, run_length):
+    # The index of the last element of the first run of `run_length`
+    # consecutive `True`s in `significant`, or None if there is no such run.
+    # (The number of `True`s in the window ending at `i` is the difference of
+    # the cumulative sums)
+    counts = np.concatenate([[0], np.cumsum(significant)])
+    in_run = np.flatnonzero(counts[run_length:] - counts[:-run_length] == run_length)
+    return in_run[0] + run_length - 1 if len(in_run) > 0 else None
+
+def find_divergence_point_using_ttests(ttests_df,
+                                       run_length=DPA_DISTANCE,
+                                       threshold=TTEST_SIGNIFICANCE,
+                                       two_sided=False,
+                                       warn=True):
     # Ok... I had calculated the t-tests for all conditions.
     # Now I just need to find, for each condition, to find the divergence point
+    # (`ttests_df` is sorted by time)
 
     # Get all conditions
-    all_conditions = ttests_df['condition'].unique()
+    all_conditions = ttests_df['condition'].unique().tolist()
     divergence_points = {}
     for i in all_conditions:
         ttests_of_cond_i = ttests_df.loc[ttests_df['condition'] == i]
+        tvalues = ttests_of_cond_i['tvalue'].to_numpy()
+        # (nan is never significant)
+        significant = np.abs(tvalues) > threshold if two_sided else tvalues > threshold
 
-        condition_count = 0
-        divergence_points[i] = None
-        for index, row in ttests_of_cond_i.iterrows():
-            if row['tvalue'] > TTEST_SIGNIFICANCE:
-                condition_count += 1
-            else:
-                condition_count = 0
-
-            if condition_count >= DPA_DISTANCE:
-                divergence_points[i] = row['time'] - DPA_DISTANCE
-                del ttests_of_cond_i
-                break
+        # As it has always been, the divergence point is `run_length` ms before
+        # the end of the first run (i.e., the ms just before the run starts)
+        end_of_run = find_first_run(significant, run_length)
+        divergence_points[i] = None \
+                                if end_of_run is None \
+                                else int(ttests_of_cond_i['time'].iloc[end_of_run]) - run_length
 
         # We should ALWAYS find a divergence point
-        #assert(divergence_points[i] is not None)
+        if divergence_points[i] is None and warn:
+            print("*-*-*-*-*")
+            print("WARNING: NO DIVERGENCE POINT FOUND FOR CONDITION", i)
+            print("There are no", run_length, "consecutive ms with",
+                  "|t| >" if two_sided else "t >", threshold,
+                  "in the population. The trials of this condition will not be shifted.")
+            print("You probably want to increase `pop_multiplier`, or decrease "
+                  "`dpa_run_length` or `dpa_threshold`.")
+            print("*-*-*-*-*")
     return divergence_points
 
-def find_divergence_point(df, args):
+def find_divergence_point(looks_buffer, args, state):
     # We'll be very "mindful" of memory here, because apparently this function is
     # consuming WAY TOO MUCH memory =/
 
     print(" * will run t-tests")
-    per_ms_looks_df, ttests_df = run_ttests(df, args)
+    with profiler.stage('t-tests', rows_unit='per ms means') as counts:
+        if args.force_dpoint_fast:
+            per_ms_looks_df, ttests_df = None, estimate_population_ttests(args, state)
+        else:
+            per_ms_looks_df, ttests_df = run_ttests(looks_buffer, args)
+        counts['rows'] = len(per_ms_looks_df) \
+                            if per_ms_looks_df is not None \
+                            else args.n_subjs * args.pop_multiplier * len(ttests_df)
     print(" * will use the t-tests to find divergence points")
-    actual_divergence_points = find_divergence_point_using_ttests(ttests_df)
+    with profiler.stage('divergence detection', rows=len(ttests_df), rows_unit='t-values'):
+        actual_divergence_points = find_divergence_point_using_ttests(ttests_df,
+                                                                      args.dpa_run_length,
+                                                                      args.dpa_threshold,
+                                                                      args.dpa_sides == 'two')
     return per_ms_looks_df, ttests_df, actual_divergence_points
 
-def shift_time(df, actual_divergence_points, args):
+def get_population_cache_file(args):
+    # The divergence points only depend on the parameters of the population
+    # (and on how we measure them), so that's what identifies them in the cache
+    params = {key: value for key, value in vars(args).items()
+              if key in ['n_conds', 'n_trials', 'trial_len', 'dpoint',
+                         'dspeed_slow_factor', 'cond_effect', 'engine',
+                         'dpa_run_length', 'dpa_threshold', 'dpa_sides']
+                 or key.endswith('_sd') or key.endswith('_prob')}
+    params['population_size'] = args.n_subjs * args.pop_multiplier
+    if args.population_tolerance is not None and not args.force_dpoint_fast:
+        # (then `population_size` is the maximum)
+        params['population_tolerance'] = args.population_tolerance
+        params['population_batch'] = args.population_batch or args.n_subjs
+    params['method'] = 'fast' if args.force_dpoint_fast else 'exact'
+    params['version'] = POPULATION_CACHE_VERSION
+    key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return os.path.join(args.population_cache, key + '.json'), params
+
+def load_cached_divergence_points(args):
+    # Returns the divergence points and how many participants the population
+    # they were measured in had, or (None, None) if they are not in the cache
+    cache_file, _ = get_population_cache_file(args)
+    try:
+        with open(cache_file) as f:
+            entry = json.load(f)
+        # (this is what makes the eviction "least recently used")
+        os.utime(cache_file)
+    except (OSError, ValueError):
+        return None, None
+    if None in entry['divergence_points'].values():
+        # (older versions also stored populations without a divergence point)
+        return None, None
+    return {int(cond): dpoint for cond, dpoint in entry['divergence_points'].items()}, \
+           entry['population_size_used']
+
+def store_divergence_points(actual_divergence_points, args):
+    # A population without a divergence point (see the warning of
+    # `find_divergence_point_using_ttests()`) is not stored, otherwise every
+    # later dataset would silently not be shifted
+    if None in actual_divergence_points.values():
+        print("Not storing the divergence points in", args.population_cache,
+              "(some were not found)")
+        return
+    cache_file, params = get_population_cache_file(args)
+    os.makedirs(args.population_cache, exist_ok=True)
+    # Written into a temporary file first, so that other runs (e.g., of
+    # `run_generator.py`) never read half an entry
+    tmp_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'parameters': params,
+                   'population_size_used': args.population_size,
+                   'divergence_points': actual_divergence_points,
+                   'time_offsets': get_time_offsets(actual_divergence_points, args)},
+                  f, indent=2)
+    os.replace(tmp_file, cache_file)
+    evict_population_cache(args.population_cache, args.population_cache_max_mb)
+
+def evict_population_cache(cache_folder, max_mb):
+    # Deletes the least recently used entries until the folder fits in `max_mb`
+    entries = []
+    for file_name in os.listdir(cache_folder):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_folder, file_name))
+        except OSError:
+            # (another run deleted it)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file_name))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, file_name in sorted(entries):
+        if total_size <= max_mb * 2**20:
+            break
+        try:
+            os.remove(os.path.join(cache_folder, file_name))
+        except OSError:
+            pass
+        total_size -= size
+
+def get_time_offsets(actual_divergence_points, args):
+    # This is how much we want to trim the beginning of every trial of each
+    # condition (note the order of the calculation. Typically, the
+    # `actual_divergence_point` will be *after* `args.dpoint`)
+    return [0 if actual_dpoint is None    # (see `find_divergence_point_using_ttests()`)
+            else actual_dpoint - (args.dpoint + cond*args.cond_effect)
+            for cond, actual_dpoint in sorted(actual_divergence_points.items())]
+
+def shift_participants(looks_buffer, actual_divergence_points, args, out_stream=None):
     # "Trim" the number of participants, so that we only have
-    # `args.n_subjects` participants
+    # `args.n_subjects` participants, and shift their trials by the offsets of
+    # `get_time_offsets()`. The offsets are applied while the fixations are
+    # expanded into rows (see `DatasetBuffer`), so the data frame is built
+    # only once, already shifted and trimmed.
     # (If using the `memory efficienty` algorithm, this will end up sampling
-    # all the participants of the dataset, because the sampling happened before)
+    # all the participants of `looks_buffer`, because the sampling happened
+    # before)
     print(" * will sample the participants from the population")
-    participants_to_keep = random.sample(list(df['participant'].unique()), args.n_subjs)
-    out_df = df.loc[df['participant'].isin(participants_to_keep)].copy()
-    del df
-
-    print(" * will trim the trials to have the correct length")
-    for cond, actual_dpoint in actual_divergence_points.items():
-        # This is how much we want to trim the beginning of every trial in the dataset
-        # (note the order of the calculation. Typically, the `actual_divergence_point`
-        # will be *after* `args.point`)
-        time_is_off_by = actual_dpoint - (args.dpoint + cond*args.cond_effect)
-
-        # Shift the trials by the calculated offset
-        out_df.loc[out_df['condition'] == cond, 'time'] -= time_is_off_by
-
-    # Trim any `ms` that is below 0 or above the user-defined trial length
-    out_df = out_df.loc[out_df['time'] >= 0]
-    out_df = out_df.loc[out_df['time'] < args.trial_len]
-    return out_df
+    participants_to_keep = set(random.sample(looks_buffer.subj_ids, args.n_subjs))
+    time_offsets = get_time_offsets(actual_divergence_points, args)
+
+    print(" * will shift and trim the trials to have the correct length")
+    subj_data = new_buffer(args.n_subjs, args, time_offsets)
+    for subj_id, fixations in zip(looks_buffer.subj_ids, looks_buffer.fixations):
+        if subj_id not in participants_to_keep:
+            continue
+        if out_stream is not None:
+            # Written one by one
+            subj_data = new_buffer(1, args, time_offsets)
+        with profiler.stage('time shifting', rows_unit='trial ms') as counts:
+            subj_data.add_subj(subj_id, fixations)
+            counts['rows'] = args.n_conds * args.n_trials * get_trial_window(args)[0]
+        if out_stream is not None:
+            with profiler.stage('data frame', rows_unit='rows') as counts:
+                subj_df = subj_data.to_dataframe()
+                counts['rows'] = len(subj_df)
+            with profiler.stage('output', rows=len(subj_df), rows_unit='rows'):
+                out_stream.write(subj_df)
+
+    if out_stream is None:
+        with profiler.stage('data frame', rows_unit='rows') as counts:
+            out_df = subj_data.to_dataframe()
+            counts['rows'] = len(out_df)
+        return out_df
 
 
 #####################################
 
 
-if __name__ == '__main__':
-    # Tests the functionalities of this file
-    print("Parsing command line")
-    args = parse_command_line()
-
-    if not args.force_dpoint and not args.force_dpoint_me:
+class GeneratedDataset:
+    # What `run()` (and `generate()`) return. `data` is the data frame that
+    # is (or would be) written into `args.out_file` (None when it was
+    # streamed), and `divergence_points` are the ones measured in the
+    # population (None without `force_dpoint`)
+    def __init__(self, args, data, divergence_points, state):
+        self.args = args
+        self.data = data
+        self.divergence_points = divergence_points
+        self.state = state
+
+def run(args, write=True):
+    # Generates a dataset, as described by `args` (see `parse_command_line()`).
+    # With `write`, it goes into `args.out_file` (and `--stream` requires it).
+    # Everything this needs is created here (see `DatasetState`), so it can be
+    # called many times in the same process
+    global profiler
+    if args.stream and not write:
+        raise ValueError('`stream` requires `write`')
+
+    if not is_forcing_dpoint(args):
         # This will make the code produce many more participants
         # (which is necessary for `force_dpoint[_me]`
         args.pop_multiplier = 1
@@ -794,14 +2398,71 @@ if __name__ == '__main__':
         print('Received random seed. Setting it')
         random.seed(args.rand_seed)
 
-    print("Generating data")
-    out_df = generate_data(args)
+    # (a new one, so that the stages of previous datasets don't add up)
+    profiler = Profiler()
+    if args.profile:
+        profiler.enable()
+    try:
+        return generate_dataset(args, write)
+    finally:
+        profiler.disable()
+
+def generate_dataset(args, write):
+    # The stages of `run()`, which sets everything up (and returns what this
+    # returns)
+    if (args.stream or args.population_tolerance is not None) and args.force_dpoint:
+        # When streaming, we never have the whole population in memory, so
+        # we need the per participant looks of the memory efficient algorithm.
+        # (With `population_tolerance`, we need them after every batch)
+        args.force_dpoint_me = True
+
+    state = DatasetState(args)
+    out_df = None
+    actual_divergence_points = None
+
+    if args.stream:
+        # (see `get_partial_file()`)
+        partial_file = get_partial_file(args.out_file)
+        out_stream = open_stream(args, partial_file)
+
+    cached_divergence_points = None
+    if is_forcing_dpoint(args) and args.population_cache:
+        cached_divergence_points, cached_population_size = load_cached_divergence_points(args)
+        if cached_divergence_points is not None:
+            print("Found the divergence points of the population in",
+                  args.population_cache)
 
-    if args.force_dpoint or args.force_dpoint_me:
-        from scipy import stats
-        print("Calculating t-tests and forcing divergence point")
-        per_ms_looks_df, ttests_df, actual_divergence_points = \
-                                        find_divergence_point(out_df, args)
+    print("Generating data")
+    if is_forcing_dpoint(args):
+        # The participants only become rows once we know how much to shift
+        # them (see `shift_participants()`)
+        looks_buffer = generate_data(args, state, LooksBuffer(),
+                                     simulate_population=not args.force_dpoint_fast
+                                                         and cached_divergence_points is None)
+        # (`generate_data()` only counted the participants it simulated, but
+        # the divergence points come from a larger population)
+        if cached_divergence_points is not None:
+            args.population_size = cached_population_size
+        elif args.force_dpoint_fast:
+            args.population_size = args.n_subjs * args.pop_multiplier
+    elif args.stream:
+        generate_data(args, state, out_stream)
+    else:
+        all_data = generate_data(args, state)
+        with profiler.stage('data frame', rows_unit='rows') as counts:
+            out_df = all_data.to_dataframe()
+            counts['rows'] = len(out_df)
+        del all_data
+
+    if is_forcing_dpoint(args):
+        if cached_divergence_points is not None:
+            actual_divergence_points = cached_divergence_points
+        else:
+            print("Calculating t-tests and forcing divergence point")
+            per_ms_looks_df, ttests_df, actual_divergence_points = \
+                                            find_divergence_point(looks_buffer, args, state)
+            if args.population_cache:
+                store_divergence_points(actual_divergence_points, args)
         # if args.dump_per_ms_look_probs:
         #     print('Dumping per ms and participant look probabilities to target')
         #     per_ms_looks_df.to_csv('per_ms_look_probs.csv')
@@ -810,15 +2471,66 @@ if __name__ == '__main__':
         #         f.write("{}".format(actual_divergence_points))
         #     del per_ms_looks_df, ttests_df
 
-        out_df = shift_time(out_df, actual_divergence_points, args)
+        out_df = shift_participants(looks_buffer, actual_divergence_points, args,
+                                    out_stream if args.stream else None)
+        del looks_buffer
+
+    if args.stream:
+        with profiler.stage('output'):
+            out_stream.close()
+    elif write:
+        print("Dumping into output file")
+        with profiler.stage('output', rows=len(out_df), rows_unit='rows'):
+            partial_file = get_partial_file(args.out_file)
+            write_dataframe(out_df, args, partial_file)
+    if write:
+        os.replace(partial_file, args.out_file)
+
+    if args.profile and write:
+        print("Writing profile into", args.out_file + '.profile.json')
+        profiler.dump(args.out_file, args)
+
+    return GeneratedDataset(args, out_df, actual_divergence_points, state)
+
+def generate(params=None, seed=None, write=False, verbose=False):
+    # Generates a dataset without going through the command line, e.g.
+    # `generate({'n_subjs': 20, 'engine': 'numpy'}, seed='abc').data`.
+    # `params` has the same names as the command line options (the ones not
+    # given keep their default), and `seed` is the `rand_seed` (a random one,
+    # if None). Returns a `GeneratedDataset`. Nothing is kept between calls,
+    # and `random` is left as it was
+    def error(message):
+        raise ValueError(message)
+
+    args = parse_command_line([])
+    params = dict(params or {})
+    unknown = set(params) - set(vars(args))
+    if unknown:
+        error('Unknown parameters: ' + ', '.join(sorted(unknown)))
+    vars(args).update(params)
+    args.rand_seed = str(random.SystemRandom().getrandbits(64)) if seed is None else seed
+    check_args(args, error)
+
+    random_state = random.getstate()
+    try:
+        if verbose:
+            return run(args, write)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return run(args, write)
+    finally:
+        random.setstate(random_state)
+
 
-    print("Dumping into output file")
-    out_df.to_csv(args.out_file)
+if __name__ == '__main__':
+    # Tests the functionalities of this file
+    print("Parsing command line")
+    args = parse_command_line()
+    dataset = run(args)
 
     # if args.dump_per_trial_fixation_stats:
     #     import statistics as s
     #     print("Calculating per trial fixation stats")
-    #     stats = per_trial_fixation_stats()
+    #     stats = per_trial_fixation_stats(dataset.state.fixation_lengths)
     #     print("Dumping per trial fixation stats")
     #     stats.to_csv('per_trial_fixation_stats.csv')
     #     #print(stats)
@@ -827,7 +2539,7 @@ if __name__ == '__main__':
     #     import statistics as s
     #     from plotnine import *
     #     print("Calculating overall fixation stats")
-    #     stats = overall_fixation_stats('fixation_stats')
+    #     stats = overall_fixation_stats(dataset.state.fixation_lengths, 'fixation_stats')
     #     print("Dumping per trial fixation stats")
 
     print("Done")
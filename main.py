@@ -37,7 +37,12 @@ def run_fake_data_gen(label, data_widgets, general_widgets, whole_dataset_widget
     general_params, params = extract_parameters(data_widgets, general_widgets, whole_dataset_widgets)
 
     rg.random.seed(general_params['rand_seed'])
-    rg.generate_datasets(general_params, params, update_label)
+    failed = rg.generate_datasets(general_params, params, update_label)
+    if failed:
+        label['text'] = str(len(failed)) + " dataset(s) failed. See the folder `logs` " \
+                        "in the output folder"
+    else:
+        label['text'] = "Done"
 
 
 class Field:
@@ -122,6 +127,20 @@ class ListField(TextField):
         return list(eval(content))[:-1]
 
 
+class ChoiceField(Field):
+    def __init__(self, frame, defaults, hover_panel, text, varname, tooltip, choices):
+        super().__init__(frame, defaults, hover_panel, text, tooltip)
+        self.varname = varname
+        self.default_value = defaults[varname]
+
+        self.value = tk.StringVar(value=self.default_value)
+        self.option_menu_obj = tk.OptionMenu(self.own_frame, self.value, *choices)
+        self.option_menu_obj.grid(row=0, column=1, sticky=tk.E)
+
+    def get_value(self):
+        return self.value.get()
+
+
 class CheckboxField(Field):
     def __init__(self, frame, defaults, hover_panel, text, varname, tooltip):
         super().__init__(frame, defaults, hover_panel, text, tooltip)
@@ -154,6 +173,36 @@ general_vars = [
      'combination is referred to as a "parameter set".\n\n'
      'This variable defines how many datasets should be created for each '
      'combination.'),
+    (NumberField, 'Parallel datasets', 'jobs',
+     'How many datasets are generated at the same time (each by its own '
+     'process). Use about as many as your computer has cores. (If you also set '
+     '`Worker processes`, every dataset uses that many processes.)\n\n'
+     'What each generator prints goes into the folder `logs` inside the output '
+     'folder (one .stdout.log and one .stderr.log per dataset).'),
+    (NumberField, 'Retries', 'retries',
+     'How many times a dataset whose generator failed (e.g., crashed, or was '
+     'killed for using too much memory) is generated again, with the same seed.'),
+    (CheckboxField, 'Resume', 'resume',
+     'Every sweep keeps a `manifest.json` in the output folder, with the '
+     'parameters, seed, output file and status of every dataset. (Datasets are '
+     'written into hidden files ending in `.partial`, and only renamed once '
+     'they are complete.)\n\n'
+     'If this is checked, the datasets that the manifest says are done (and '
+     'whose output file is still there) are skipped, the `.partial` files of '
+     'interrupted datasets are deleted, and only the missing or '
+     'failed ones are generated, with the seeds they had. Use it to continue a '
+     'sweep that was interrupted.'),
+    (CheckboxField, 'Worker pool', 'worker_pool',
+     'Without this, every dataset is generated by a new Python process, which '
+     'first has to start and import pandas and numpy. That can take longer '
+     'than generating a small dataset.\n\n'
+     'If this is checked, `Parallel datasets` processes are started once, and '
+     'each of them generates many datasets. At the end, it prints how much '
+     'time this saved.'),
+    (NumberField, 'Datasets per pool process', 'jobs_per_worker',
+     'With `Worker pool`, how many datasets a process generates before it is '
+     'replaced by a new one (so that the memory it keeps doesn\'t pile up). '
+     '0 means never.'),
     (TextField, 'Random seed', 'rand_seed',
      'The random seed (this can be any number).\n\n'
      'It will be used to generate random seeds for the generated datasets. '
@@ -189,11 +238,133 @@ general_vars = [
     (CheckboxField, 'Force Divergence Point (Memory efficient)', 'force_dp_memory_efficient',
      'A "memory efficient" version of the `Force Divergence Point` algorithm. '
      '(this is mutually exclusive with `Force Divergence Point`)'),
+    (CheckboxField, 'Force Divergence Point (Fast)', 'force_dp_fast',
+     'An approximate (but, with the `python` engine, much faster) version of the '
+     '`Force Divergence Point` algorithm: the Div. Point of the larger population is estimated from the '
+     'probabilities of looks to the Target of its trials, without simulating '
+     'its fixations. With the `numpy` engine it is not faster than the memory '
+     'efficient version. Run `benchmark_force_dpoint_fast.py` to see how close it '
+     'gets to the memory efficient version for your parameters.\n\n'
+     '(this is mutually exclusive with the two above)'),
     (TextField, 'Population Multiplier', 'population_multiplier',
      '(Only useful if `Force Divergence Point` (both Memory efficient and Not) is set).\n\n'
      'This will be used to define the size of the "larger population" in the '
      'description of `Force Divergence Point` above. It will have size: '
      '`Number of Participants * Population Multiplier`. '),
+    (NumberField, 'Population DPA run length', 'dpa_run_length',
+     '(Only useful if `Force Divergence Point` (both Memory efficient and Not) is set).\n\n'
+     'How many consecutive ms need to have significant t-tests for the DPA of the '
+     'larger population to decide that the looks to the Target diverged. The '
+     'divergence point is the ms just before these consecutive ms.'),
+    (TextField, 'Population DPA t-value threshold', 'dpa_threshold',
+     '(Only useful if `Force Divergence Point` (both Memory efficient and Not) is set).\n\n'
+     'The t-value above which a t-test is considered significant in the DPA of '
+     'the larger population.'),
+    (ChoiceField, 'Population DPA t-tests', 'dpa_sides',
+     '(Only useful if `Force Divergence Point` (both Memory efficient and Not) is set).\n\n'
+     '-> "one": only t-values above the threshold (i.e., more looks to the Target) '
+     'are significant.\n'
+     '-> "two": t-values below minus the threshold are also significant.\n\n'
+     'If no divergence point is found for a condition, a warning is shown and the '
+     'trials of that condition are not shifted.',
+     ['one', 'two']),
+    (TextField, 'Population tolerance (ms)', 'population_tolerance',
+     '(Only useful if `Force Divergence Point` (but not the Fast one) is set).\n\n'
+     'If not empty, the larger population does not have a fixed size. Its '
+     'participants are simulated in batches (see `Population batch size`), and '
+     'after each batch the divergence points are measured again. The simulation '
+     'stops when they moved at most this many ms (in every condition) since the '
+     'previous batch, or when the population reaches `Number of Participants` x '
+     '`Population Multiplier` participants (i.e., `Population Multiplier` '
+     'becomes the maximum). How many were simulated is written as '
+     '`population_size` into the .json of the "npy" output and into the '
+     '`.profile.json`.'),
+    (NumberField, 'Population batch size', 'population_batch',
+     '(Only useful if `Population tolerance (ms)` is set).\n\n'
+     'How many participants are simulated between two measurements of the '
+     'divergence points. 0 means `Number of Participants`.'),
+    (TextField, 'Population cache folder', 'population_cache',
+     '(Only useful if `Force Divergence Point` (any of them) is set).\n\n'
+     'If not empty, the divergence points measured in the larger population are '
+     'kept in this folder. Datasets with the same parameters (and the same '
+     'population size, i.e. `Number of Participants` times `Population '
+     'Multiplier`, and `Generation engine`) then reuse them instead of '
+     'simulating the population again, which is MUCH faster. (All of them get '
+     'the same shift, since it was measured in a single population.)'),
+    (NumberField, 'Population cache size (MB)', 'population_cache_max_mb',
+     'When the `Population cache folder` gets larger than this, the entries that '
+     'were used the longest ago are deleted.'),
+    (ChoiceField, 'Generation engine', 'engine',
+     'Which implementation generates the trials.\n\n'
+     '-> "python" is the reference implementation. It goes through every '
+     'trial one millisecond at a time (slow).\n'
+     '-> "numpy" generates all trials of a participant at once. It is MUCH '
+     'faster and follows the same model, but uses a different random number '
+     'generator, so the same random seed will produce different datasets in '
+     'the two engines.',
+     ['python', 'numpy']),
+    (NumberField, 'Worker processes', 'workers',
+     'How many processes generate the participants of each dataset (use about '
+     'as many as your computer has cores).\n\n'
+     'If larger than 0, every participant has its own random numbers (derived '
+     'from the random seed of the dataset and the index of the participant), so '
+     'the datasets are exactly the same for ANY number of processes. But they '
+     'are not the same as with 0, where all participants are generated one '
+     'after the other by a single process, as before.'),
+    (CheckboxField, 'Stream into output file', 'stream',
+     'If set, every participant is written into the output file as soon as it '
+     'is generated, instead of keeping the whole dataset in memory until the '
+     'end. The produced file is the same, but much less memory is needed for '
+     'large datasets.\n\n'
+     '(this cannot be used with the "feather" `Output format`)'),
+    (NumberField, 'Background writer queue', 'writer_queue',
+     '(Only useful if `Stream into output file` is set).\n\n'
+     'If larger than 0, participants are written into the output file by a '
+     'background thread, while the next participants are being generated. '
+     'This is how many participants can be waiting to be written. (larger '
+     'values use more memory.) 2 is usually enough. 0 means that participants '
+     'are written right after they are generated, before generating the next.'),
+    (ChoiceField, 'Output format', 'out_format',
+     'The format of the generated files.\n\n'
+     '-> "csv" produces text files (with extension .txt) that can be opened '
+     'anywhere.\n'
+     '-> "parquet" and "feather" produce binary files that are MUCH smaller and '
+     'faster to write and to read (for example, with `pd.read_parquet()` in '
+     'Python or `arrow::read_parquet()` in R). They require the library pyarrow '
+     '(`pip install pyarrow`).\n'
+     '-> "npy" produces a numpy array (participants x conditions x trials x ms) '
+     'with the object looked at in every ms (0: Target, 1: Distractor, 2: Away, '
+     '255: no data), plus a .json file with the ids and parameters. Load it with '
+     '`np.load(file, mmap_mode="r")`.\n'
+     '-> "fixations" produces a text (csv) file with one row per fixation '
+     '(like the fixation reports of eye-trackers), with columns `start`, `end`, '
+     '`duration` and `fixated_object`. These files are MUCH smaller.',
+     ['csv', 'parquet', 'feather', 'npy', 'fixations']),
+    (ChoiceField, 'Output layout', 'layout',
+     '-> "long": two rows per ms, one for the Target and one for the Distractor, '
+     'saying whether each of them was being looked at (columns `object` and '
+     '`is_looking`).\n'
+     '-> "wide": a single row per ms, with a column `fixated_object` that is '
+     'either "Target", "Distractor" or "Away". The files are half the size, and '
+     'the looks away from the monitor are kept (in "long" they are just two '
+     'zeros).\n\n'
+     '(this has no effect if `Output format` is "npy" or "fixations")',
+     ['long', 'wide']),
+    (ChoiceField, 'Compression', 'compression',
+     'Compress the generated files while writing them (only when `Output format` '
+     'is "csv" or "fixations"). ".gz" or ".zst" is added to the file names.\n\n'
+     '-> "gzip" files can be opened by almost anything (e.g., `read.csv()` in R '
+     'and `pd.read_csv()` in Python open them directly).\n'
+     '-> "zstd" is much faster and produces smaller files, but requires the '
+     'library zstandard (`pip install zstandard`).',
+     ['none', 'gzip', 'zstd']),
+    (CheckboxField, 'Profile', 'profile',
+     'If set, measures how long each stage of the generator takes (generating '
+     'the participants, the t-tests, writing the file, etc.) and how much memory '
+     'it uses, and writes it next to each dataset, into a file ending in '
+     '`.profile.json`. At the end, a summary of all datasets is written into '
+     '`profile_summary.json` in the output folder.\n\n'
+     '(measuring memory makes the generator somewhat slower)'),
     # (CheckboxField, 'Dump per trial fixation stats', 'dump_per_trial_fixation_stats', False,
     #  'Additional stats on the length of each trial fixation.'),
     # (CheckboxField, 'Dump overall fixation stats', 'dump_overall_fixation_stats', False,
@@ -1,9 +1,19 @@
 import sys
 import subprocess
 import os
+import ast
+import time
 import itertools
+import argparse
+import collections
 import random
 import string
+import json
+import hashlib
+import queue
+import threading
+import traceback
+import contextlib
 
 
 # Where is Python / what is Python named in this computer?
@@ -15,6 +25,59 @@ DPA_FAKE_DATA_GEN = os.path.join(os.path.dirname(os.path.realpath(__file__)), "d
 # Used for `random_string()`
 alphabet = string.ascii_lowercase + string.digits
 
+# The extension of the produced files, for each `out_format`
+# (csv files have always been produced as .txt)
+OUT_FORMAT_EXTENSIONS = {
+    'csv': '.txt',
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'npy': '.npy',
+    'fixations': '_fixations.txt',
+}
+
+# Added after the extension above when the (text) outputs are compressed
+COMPRESSION_EXTENSIONS = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# The parameters that can have multiple values (one dataset is generated for
+# every combination of them). Everything else in `config.py` is the same for
+# all datasets
+DATASET_PARAMS = [
+    'n_subjs', 'n_conds', 'n_trials', 'trial_len', 'dpoint', 'cond_effect',
+    'rand_dp_noise_sd', 'rand_prob_noise_sd', 'rand_dspeed_noise_sd',
+    'subj_per_trial_dpoint_var_sd', 'subj_per_trial_bias_var_sd',
+    'subj_per_trial_dspeed_var_sd', 'subj_dpoint_rand_intercept_sd',
+    'subj_dpoint_rand_slope_sd', 'subj_bias_var_sd', 'subj_dspeed_bias_var_sd',
+    'item_dpoint_bias_sd', 'item_prob_bias_sd', 'item_dspeed_bias_sd',
+    'outmonitor_look_prob', 'subj_outmonitor_look_bias_sd',
+]
+
+# How often (in seconds) we check whether the running jobs have finished
+POLL_INTERVAL = 0.1
+
+# The manifest of a sweep (see `load_manifest()`), in `out_folder`
+MANIFEST_FILE = 'manifest.json'
+
+# The arguments of `dpa_fake_data_gen.py` that change how a dataset is
+# generated, but not the data (see `get_params_hash()`), with how many values
+# each of them takes
+NON_DATA_ARGS = {
+    '--profile': 0,
+    '--stream': 0,
+    '--writer_queue': 1,
+    '--population_cache': 1,
+    '--population_cache_max_mb': 1,
+    '--workers': 1,
+}
+
+# The end of the (hidden) files that the generator writes before renaming
+# them (same as in `dpa_fake_data_gen.py`)
+PARTIAL_SUFFIX = '.partial'
+
+
 def random_string(length = 6):
     # This is the `random_choice` method from https://stackoverflow.com/a/56398787
     return ''.join(random.choices(alphabet, k=length))
@@ -26,7 +89,22 @@ def generate_combinations(dictionary):
     return permutations_dicts
 
 
-def run_fake_data_generator(general_params, params, d_idx, seed):
+def parse_list(value):
+    # Same as the `ListField`s of `main.py`: "100, 200" -> [100, 200]
+    return list(ast.literal_eval('[' + str(value) + ']'))
+
+def read_config(config):
+    # `config.py` as `main.py` would pass it to `generate_datasets()`: the
+    # `DATASET_PARAMS` are lists of values, and everything else is "general"
+    params = {key: parse_list(config[key]) for key in DATASET_PARAMS}
+    general_params = {key: value for key, value in config.items() if key not in DATASET_PARAMS}
+    # (the seed of the GUI is a string, and `random.seed()` treats strings
+    # and numbers differently)
+    general_params['rand_seed'] = str(general_params['rand_seed'])
+    return general_params, params
+
+
+def get_out_file_name(general_params, params, seed):
     out_file_name = '_'.join([general_params['out_file'],
                               'sub' + str(params['n_subjs']),
                               'cond' + str(params['n_conds']),
@@ -52,11 +130,15 @@ def run_fake_data_generator(general_params, params, d_idx, seed):
 
                               "olp" + str(params['outmonitor_look_prob']),
                               "solpsd" + str(params['subj_outmonitor_look_bias_sd']),
-                              seed]) + '.txt'
+                              seed]) + OUT_FORMAT_EXTENSIONS[general_params['out_format']]
+    if general_params['out_format'] in ['csv', 'fixations']:
+        out_file_name += COMPRESSION_EXTENSIONS[general_params['compression']]
+    return out_file_name
 
+def get_generator_args(general_params, params, out_file, seed):
+    # The command line arguments of `dpa_fake_data_gen.py` for one dataset
     run_args = [
-        PY, str(DPA_FAKE_DATA_GEN),
-        "--out_file", os.path.join(general_params['out_folder'], str(out_file_name)),
+        "--out_file", out_file,
         "--rand_seed", str(seed),
         "--n_subjs", str(params['n_subjs']),
         "--n_conds", str(params['n_conds']),
@@ -81,6 +163,13 @@ def run_fake_data_generator(general_params, params, d_idx, seed):
         "--outmonitor_look_prob", str(params['outmonitor_look_prob']),
         "--subj_outmonitor_look_bias_sd", str(params['subj_outmonitor_look_bias_sd']),
         "--pop_multiplier", str(general_params['population_multiplier']),
+        "--dpa_run_length", str(general_params['dpa_run_length']),
+        "--dpa_threshold", str(general_params['dpa_threshold']),
+        "--dpa_sides", str(general_params['dpa_sides']),
+        "--engine", str(general_params['engine']),
+        "--out_format", str(general_params['out_format']),
+        "--layout", str(general_params['layout']),
+        "--compression", str(general_params['compression']),
     ]
     #if general_params['dump_per_trial_fixation_stats']:
     #    run_args.append("--dump_per_trial_fixation_stats")
@@ -90,20 +179,493 @@ def run_fake_data_generator(general_params, params, d_idx, seed):
         run_args.append("--force_dpoint")
     if general_params['force_dp_memory_efficient']:
         run_args.append("--force_dpoint_me")
+    if general_params.get('force_dp_fast'):
+        run_args.append("--force_dpoint_fast")
+    if general_params.get('workers'):
+        run_args.extend(["--workers", str(general_params['workers'])])
+    if general_params['stream']:
+        run_args.append("--stream")
+        run_args.extend(["--writer_queue", str(general_params['writer_queue'])])
+    if general_params.get('profile'):
+        run_args.append("--profile")
+    if general_params.get('population_tolerance') not in [None, '']:
+        run_args.extend(["--population_tolerance", str(general_params['population_tolerance'])])
+        if general_params.get('population_batch'):
+            run_args.extend(["--population_batch", str(general_params['population_batch'])])
+    if general_params.get('population_cache'):
+        run_args.extend(["--population_cache", str(general_params['population_cache']),
+                         "--population_cache_max_mb",
+                         str(general_params['population_cache_max_mb'])])
+    return run_args
+
+def run_fake_data_generator(general_params, params, d_idx, seed, stdout=None, stderr=None):
+    out_file = os.path.join(general_params['out_folder'],
+                            str(get_out_file_name(general_params, params, seed)))
+    run_args = [PY, str(DPA_FAKE_DATA_GEN)] + \
+                get_generator_args(general_params, params, out_file, seed)
+    return subprocess.Popen(run_args, stdout=stdout, stderr=stderr), out_file
+
+def measure_startup_time():
+    # How long a new Python takes to start and import the generator (and with
+    # it pandas and numpy), i.e., what every dataset pays without the pool
+    start = time.perf_counter()
+    subprocess.run([PY, '-c', 'import dpa_fake_data_gen'], check=True,
+                   cwd=os.path.dirname(DPA_FAKE_DATA_GEN))
+    return time.perf_counter() - start
+
+@contextlib.contextmanager
+def redirect_output(log_file):
+    # Same as the `stdout` and `stderr` of `run_fake_data_generator()`, but
+    # for this process. (The file descriptors are redirected, so that also
+    # what the `--workers` of the generator print goes into the logs)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(log_file + '.stdout.log', 'a') as stdout, \
+         open(log_file + '.stderr.log', 'a') as stderr:
+        os.dup2(stdout.fileno(), 1)
+        os.dup2(stderr.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+
+def run_pool_job(dpa, run_args, log_file):
+    # Does the same as running `dpa_fake_data_gen.py` with `run_args`, but in
+    # this process (`dpa` is the already imported module). Returns its exit
+    # code and how long it took
+    start = time.perf_counter()
+    with redirect_output(log_file):
+        try:
+            dpa.run(dpa.parse_command_line(run_args))
+            returncode = 0
+        except SystemExit as e:
+            # (e.g., `argparse` didn't like the arguments)
+            returncode = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+    return returncode, time.perf_counter() - start
+
+def run_pool_worker():
+    # A process of the `WorkerPool` (`run_generator.py --pool_worker`). It
+    # imports the generator once, and then runs every job it receives (the
+    # `run_args` and log file, as json, one per line in stdin), answering
+    # each with its exit code and time (one per line in stdout)
+    results = os.fdopen(os.dup(1), 'w')
+    # (anything else printed into stdout would be taken as an answer)
+    os.dup2(2, 1)
+    import dpa_fake_data_gen as dpa
+    for line in sys.stdin:
+        run_args, log_file = json.loads(line)
+        results.write(json.dumps(run_pool_job(dpa, run_args, log_file)) + '\n')
+        results.flush()
+
+class PoolWorker:
+    def __init__(self):
+        self.process = subprocess.Popen([PY, os.path.realpath(__file__), '--pool_worker'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True)
+        self.n_jobs = 0
+        self.results = queue.Queue()
+        threading.Thread(target=self.read_results, daemon=True).start()
+
+    def read_results(self):
+        for line in self.process.stdout:
+            self.results.put(json.loads(line))
+        # (the process has ended)
+        self.results.put(None)
+
+    def send(self, run_args, log_file):
+        self.n_jobs += 1
+        self.process.stdin.write(json.dumps([run_args, log_file]) + '\n')
+        self.process.stdin.flush()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+class WorkerPool:
+    # Long-lived processes (see `run_pool_worker()`) that import the generator
+    # once and then generate many datasets, instead of a new Python for every
+    # dataset. A process is replaced after `jobs_per_worker` datasets (0 =
+    # never), so that whatever memory it keeps doesn't pile up. There are never
+    # more processes than jobs running at the same time
+    def __init__(self, jobs_per_worker):
+        self.jobs_per_worker = jobs_per_worker
+        self.idle = []
+        self.startup_time = measure_startup_time()
+        self.warm_jobs = 0
+        self.cold_jobs = 0
+
+    def submit(self, run_args, log_file):
+        # Returns something that looks like a `subprocess.Popen` to `run_jobs()`
+        while self.idle and not self.idle[-1].is_alive():
+            self.idle.pop()
+        worker = self.idle.pop() if self.idle else PoolWorker()
+        return PoolJob(self, worker, run_args, log_file)
+
+    def finished(self, job):
+        if job.warm:
+            self.warm_jobs += 1
+        else:
+            self.cold_jobs += 1
+        worker = job.worker
+        if worker.is_alive() and (self.jobs_per_worker <= 0 or worker.n_jobs < self.jobs_per_worker):
+            self.idle.append(worker)
+        elif worker.is_alive():
+            worker.stop()
+
+    def report(self):
+        n_jobs = self.warm_jobs + self.cold_jobs
+        if n_jobs == 0:
+            return
+        saved = self.warm_jobs * self.startup_time
+        print("Worker pool: {} of {} datasets ran in an already started process. "
+              "Starting Python and importing the generator takes {:.2f}s, so the "
+              "pool saved about {:.1f}s ({:.2f}s per dataset)".format(
+                  self.warm_jobs, n_jobs, self.startup_time, saved, saved / n_jobs))
+
+    def close(self):
+        for worker in self.idle:
+            worker.stop()
+        self.idle = []
+        self.report()
+
+class PoolJob:
+    def __init__(self, pool, worker, run_args, log_file):
+        self.pool = pool
+        self.worker = worker
+        self.warm = worker.n_jobs > 0
+        self.returncode = None
+        self.job_time = None
+        worker.send(run_args, log_file)
+
+    def poll(self):
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            result = self.worker.results.get_nowait()
+        except queue.Empty:
+            if self.worker.is_alive():
+                return None
+            # The process died, but the processes it started (with `workers`)
+            # may still have the pipe open, so we may never see it close.
+            # (Its last answer, if any, is already in the pipe)
+            try:
+                result = self.worker.results.get(timeout=1)
+            except queue.Empty:
+                result = None
+        if result is None:
+            # The process died (e.g., was killed for using too much memory)
+            self.returncode = self.worker.process.wait() or 1
+        else:
+            self.returncode, self.job_time = result
+        self.pool.finished(self)
+        return self.returncode
 
-    return subprocess.Popen(run_args)
+    def describe(self):
+        return "{:.2f}s, {}".format(
+            self.job_time, "saved {:.2f}s of startup".format(self.pool.startup_time)
+                           if self.warm else "in a new process")
+
+def summarize_profiles(profile_files, out_file):
+    # Puts together the `.profile.json` of every dataset of the sweep: for
+    # each stage, the total and the mean/max over the datasets
+    stages = {}
+    total_times = []
+    peak_rss = []
+    for profile_file in profile_files:
+        if not os.path.exists(profile_file):
+            # (the generator probably crashed)
+            continue
+        with open(profile_file) as f:
+            profile = json.load(f)
+        total_times.append(profile['total_time_s'])
+        if profile['peak_rss_mb'] is not None:
+            peak_rss.append(profile['peak_rss_mb'])
+        for name, stage in profile['stages'].items():
+            stages.setdefault(name, []).append(stage)
+
+    summary = {
+        'n_datasets': len(total_times),
+        'total_time_s': sum(total_times),
+        'mean_time_s': sum(total_times) / len(total_times) if total_times else None,
+        'max_peak_rss_mb': max(peak_rss) if peak_rss else None,
+        'stages': {}
+    }
+    for name, per_dataset in stages.items():
+        times = [s['time_s'] for s in per_dataset]
+        rows = sum(s['rows'] for s in per_dataset)
+        summary['stages'][name] = {
+            'total_time_s': sum(times),
+            'mean_time_s': sum(times) / len(times),
+            'max_time_s': max(times),
+            'rows': rows,
+            'rows_unit': per_dataset[0]['rows_unit'],
+            'rows_per_s': rows / sum(times) if sum(times) > 0 else None,
+            'max_peak_traced_mb': max(s['peak_traced_mb'] for s in per_dataset),
+        }
+
+    with open(out_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def get_params_hash(general_params, params):
+    # Identifies the parameters of a dataset: the arguments of
+    # `dpa_fake_data_gen.py` that change the data (so not the output file, the
+    # seed, nor the `NON_DATA_ARGS`)
+    run_args = get_generator_args(general_params, params, '', '')[4:]
+    data_args = []
+    while run_args:
+        arg = run_args.pop(0)
+        n_values = NON_DATA_ARGS.get(arg, 0)
+        # (their values are dropped too)
+        del run_args[:n_values]
+        if arg == '--workers':
+            # (any number of `workers` gives the same data, but not the same
+            # as without `workers`)
+            data_args.append(arg)
+        elif arg not in NON_DATA_ARGS:
+            data_args.append(arg)
+    return hashlib.sha256(json.dumps(data_args).encode()).hexdigest()[:16]
+
+def load_manifest(out_folder):
+    # The manifest has an entry for every dataset ever generated in
+    # `out_folder`, with its parameters, seed, output file and status
+    # ('pending', 'running', 'done' or 'failed'), so that a sweep that was
+    # interrupted can be resumed (see `generate_datasets()`)
+    manifest_file = os.path.join(out_folder, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+def save_manifest(out_folder, manifest):
+    # (written into a temporary file first, so that an interrupted sweep
+    # never leaves a half-written manifest)
+    manifest_file = os.path.join(out_folder, MANIFEST_FILE)
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+def set_job_status(manifest, job, status):
+    # (only in memory: `save_manifest()` is called once for many changes,
+    # since the manifest of a large sweep is large)
+    manifest[job['key']] = {
+        'params_hash': job['params_hash'],
+        'paramset': job['paramset'],
+        'dataset': job['dataset'],
+        'params': job['params'],
+        'seed': job['seed'],
+        'out_file': job['out_file'],
+        'status': status,
+        'attempts': job['attempts'],
+    }
+
+def remove_partial_files(out_folder):
+    # What generators that crashed (or were interrupted) were writing (see
+    # `get_partial_file()` in `dpa_fake_data_gen.py`)
+    for file_name in os.listdir(out_folder):
+        if file_name.startswith('.') and file_name.endswith(PARTIAL_SUFFIX):
+            print("Removing", file_name)
+            os.remove(os.path.join(out_folder, file_name))
+
+def make_jobs(general_params, params):
+    # One job per dataset: every parameter set, `n_datasets_per_paramset`
+    # times. (The seeds are drawn in the same order as they always were, so
+    # the same `rand_seed` still gives the same datasets)
+    jobs = []
+    parameter_sets = generate_combinations(params)
+    for idx,param_set in enumerate(parameter_sets):
+        for dataset_idx in range(general_params['n_datasets_per_paramset']):
+            params_hash = get_params_hash(general_params, param_set)
+            jobs.append({'paramset': idx+1,
+                         'dataset': dataset_idx+1,
+                         'params': param_set,
+                         'params_hash': params_hash,
+                         'key': '{}_{}'.format(params_hash, dataset_idx+1),
+                         'seed': random_string(),
+                         'attempts': 0})
+    return jobs, len(parameter_sets)
+
+def set_out_file(general_params, job):
+    job['out_file'] = os.path.join(general_params['out_folder'],
+                                   get_out_file_name(general_params, job['params'], job['seed']))
+
+def start_job(general_params, job, log_folder, manifest, pool=None):
+    # The output of every job goes into its own logs (appended, so that we
+    # still see why a retried job failed)
+    job['attempts'] += 1
+    log_file = os.path.join(log_folder,
+                            get_out_file_name(general_params, job['params'], job['seed']))
+    with open(log_file + '.stdout.log', 'a') as stdout, \
+         open(log_file + '.stderr.log', 'a') as stderr:
+        for f in [stdout, stderr]:
+            f.write("=== attempt {} ===\n".format(job['attempts']))
+            f.flush()
+        if pool is None:
+            process, job['out_file'] = run_fake_data_generator(general_params, job['params'],
+                                                               job['dataset'] - 1, job['seed'],
+                                                               stdout, stderr)
+        else:
+            # (the process of the pool opens the logs by itself)
+            process = pool.submit(get_generator_args(general_params, job['params'],
+                                                     job['out_file'], job['seed']),
+                                  log_file)
+    set_job_status(manifest, job, 'running')
+    print("Started dataset {}/{} of parameter set {} (attempt {}): {}".format(
+        job['dataset'], general_params['n_datasets_per_paramset'], job['paramset'],
+        job['attempts'], job['out_file']))
+    return process
+
+def run_jobs(general_params, jobs, total_parameters_sets, additional_callback, manifest):
+    # Runs up to `jobs` generators at the same time, and runs again the ones
+    # that fail (up to `retries` times). Returns the jobs that never succeeded.
+    # The status of every job is kept up to date in `manifest` (saved at most
+    # once every `POLL_INTERVAL`).
+    # With `worker_pool`, the generators run in a `WorkerPool` instead of
+    # each in a new process
+    n_concurrent = max(1, int(general_params.get('jobs', 1)))
+    retries = int(general_params.get('retries', 0))
+    log_folder = os.path.join(general_params['out_folder'], 'logs')
+    os.makedirs(log_folder, exist_ok=True)
+    pool = None
+    if general_params.get('worker_pool') and jobs:
+        pool = WorkerPool(int(general_params.get('jobs_per_worker', 0)))
+
+    job_queue = collections.deque(jobs)
+    running = []
+    failed = []
+    while job_queue or running:
+        manifest_changed = False
+        while job_queue and len(running) < n_concurrent:
+            job = job_queue.popleft()
+            running.append((start_job(general_params, job, log_folder, manifest, pool), job))
+            manifest_changed = True
+
+        # (the GUI shows the oldest job that is still running)
+        _, job = running[0]
+        additional_callback(job['paramset'], job['dataset'], total_parameters_sets,
+                            general_params['n_datasets_per_paramset'])
+        time.sleep(POLL_INTERVAL)
+
+        still_running = []
+        for process, job in running:
+            returncode = process.poll()
+            if returncode is None:
+                still_running.append((process, job))
+                continue
+            manifest_changed = True
+            if returncode == 0:
+                if pool is not None:
+                    print("Finished ({}): {}".format(process.describe(), job['out_file']))
+                set_job_status(manifest, job, 'done')
+            elif job['attempts'] <= retries:
+                print("Dataset failed (exit code {}), will retry: {}".format(returncode, job['out_file']))
+                set_job_status(manifest, job, 'pending')
+                job_queue.appendleft(job)
+            else:
+                print("Dataset failed (exit code {}), giving up: {}".format(returncode, job['out_file']))
+                set_job_status(manifest, job, 'failed')
+                failed.append(job)
+        running = still_running
+        if manifest_changed:
+            save_manifest(general_params['out_folder'], manifest)
+
+    if pool is not None:
+        pool.close()
+    if failed:
+        print(len(failed), "of", len(jobs), "datasets failed. See their logs in", log_folder)
+    return failed
 
 def generate_datasets(general_params, params, additional_callback):
+    # Returns the jobs (see `make_jobs()`) that failed.
+    # With `resume`, the datasets that the manifest says are done (and whose
+    # output file is still there) are skipped, and the others are generated
+    # again with the seed they had
     if not os.path.exists(general_params['out_folder']):
         os.makedirs(general_params['out_folder'])
 
-    parameter_sets = generate_combinations(params)
-    total_parameters_sets = len(parameter_sets)
+    jobs, total_parameters_sets = make_jobs(general_params, params)
+    manifest = load_manifest(general_params['out_folder'])
+    if general_params.get('resume'):
+        remove_partial_files(general_params['out_folder'])
+    pending = []
+    for job in jobs:
+        entry = manifest.get(job['key'])
+        if general_params.get('resume') and entry is not None:
+            job['seed'] = entry['seed']
+        set_out_file(general_params, job)
+        if general_params.get('resume') and entry is not None and \
+                entry['status'] == 'done' and os.path.exists(job['out_file']):
+            continue
+        set_job_status(manifest, job, 'pending')
+        pending.append(job)
+    save_manifest(general_params['out_folder'], manifest)
+    if len(pending) < len(jobs):
+        print("Resuming:", len(jobs) - len(pending), "of", len(jobs),
+              "datasets are already done")
 
-    for idx,param_set in enumerate(parameter_sets):
-        for dataset_idx in range(general_params['n_datasets_per_paramset']):
-            seed = random_string()
-            process = run_fake_data_generator(general_params, param_set, dataset_idx, seed)
-            while process.poll() is None:
-                additional_callback(idx+1, dataset_idx+1, total_parameters_sets, general_params['n_datasets_per_paramset'])
+    failed = run_jobs(general_params, pending, total_parameters_sets, additional_callback, manifest)
+
+    if general_params.get('profile'):
+        summarize_profiles([job['out_file'] + '.profile.json' for job in jobs],
+                           os.path.join(general_params['out_folder'], 'profile_summary.json'))
+    return failed
+
+
+if __name__ == '__main__':
+    # Generates the datasets of `config.py` without the windowed interface
+    # (e.g., on a server without tkinter)
+    import config
+
+    argparser = argparse.ArgumentParser(
+        description='Generates the datasets described in `config.py` (the same '
+                    'as clicking on `Run Generator` in `main.py`)')
+    argparser.add_argument('--jobs', type=int, default=None,
+                           help='How many datasets are generated at the same '
+                                'time (by default, the one in `config.py`)')
+    argparser.add_argument('--retries', type=int, default=None,
+                           help='How many times a dataset that failed is '
+                                'generated again (by default, the one in '
+                                '`config.py`)')
+    argparser.add_argument('--out_folder', type=str, default=None,
+                           help='Where the datasets go (by default, the one in '
+                                '`config.py`)')
+    argparser.add_argument('--worker_pool', action='store_true', default=None,
+                           help='Generates the datasets in long-lived processes '
+                                'that import the generator only once (by '
+                                'default, the one in `config.py`)')
+    argparser.add_argument('--jobs_per_worker', type=int, default=None,
+                           help='How many datasets a process of the worker pool '
+                                'generates before it is replaced (0 = never; by '
+                                'default, the one in `config.py`)')
+    argparser.add_argument('--resume', action='store_true', default=None,
+                           help='Skips the datasets that the manifest of '
+                                '`out_folder` says are done, and generates '
+                                'only the missing or failed ones (by default, '
+                                'the one in `config.py`)')
+    # (used by the `WorkerPool`, see `run_pool_worker()`)
+    argparser.add_argument('--pool_worker', action='store_true', help=argparse.SUPPRESS)
+    cli_args = argparser.parse_args()
+    if cli_args.pool_worker:
+        run_pool_worker()
+        sys.exit(0)
+
+    general_params, params = read_config(config.config)
+    for key in ['jobs', 'retries', 'out_folder', 'resume', 'worker_pool', 'jobs_per_worker']:
+        if getattr(cli_args, key) is not None:
+            general_params[key] = getattr(cli_args, key)
 
+    random.seed(general_params['rand_seed'])
+    failed = generate_datasets(general_params, params, lambda *progress: None)
+    sys.exit(1 if failed else 0)